@@ -5,6 +5,7 @@ from bson import ObjectId
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from api.auth import session_tokens
 from api.db import auth_tokens, users
 from api.schemas.user import UserData
 
@@ -13,15 +14,35 @@ _INTERNAL_API_KEY = os.getenv("INTERNAL_API_KEY")
 auth_scheme = HTTPBearer()
 
 
+async def resolve_user_id(secret: str) -> ObjectId | None:
+    if session_tokens.is_signed(secret):
+        return session_tokens.verify(secret)
+
+    token = await auth_tokens.get(secret)
+
+    return token.user_id if token else None
+
+
+async def authenticate(secret: str) -> tuple[ObjectId | None, UserData | None]:
+    if session_tokens.is_signed(secret):
+        user_id = session_tokens.verify(secret)
+
+        return user_id, await users.get(user_id) if user_id else None
+
+    token, user = await auth_tokens.get_with_user(secret)
+
+    return token.user_id if token else None, user
+
+
 async def get_current_user_id(
     authorization: Annotated[HTTPAuthorizationCredentials, Depends(auth_scheme)],
 ) -> ObjectId:
-    token = await auth_tokens.get(authorization.credentials)
+    user_id = await resolve_user_id(authorization.credentials)
 
-    if not token:
+    if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    return token.user_id
+    return user_id
 
 
 CurrentUserID = Annotated[ObjectId, Depends(get_current_user_id)]
@@ -30,15 +51,11 @@ CurrentUserID = Annotated[ObjectId, Depends(get_current_user_id)]
 async def get_current_user(
     authorization: Annotated[HTTPAuthorizationCredentials, Depends(auth_scheme)],
 ) -> UserData:
-    token = await auth_tokens.get(authorization.credentials)
+    user_id, user = await authenticate(authorization.credentials)
 
-    if not token:
+    if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user_id = token.user_id
-
-    user = await users.get(user_id)
-
     if not user:
         raise HTTPException(status_code=401, detail="Current user not found")
 
@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from bson import ObjectId
+
+_VERSION = "v1"
+_TTL = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+
+
+def _parse_keys(keys: str) -> dict[str, bytes]:
+    parsed = {}
+
+    for entry in keys.split(","):
+        if entry.strip():
+            key_id, secret = entry.strip().split(":", 1)
+            parsed[key_id] = secret.encode()
+
+    return parsed
+
+
+# SESSION_TOKEN_KEYS is a comma separated list of "<key id>:<secret>" pairs. The first
+# key signs new tokens; the others are only accepted so that keys can be rotated.
+_KEYS = _parse_keys(os.getenv("SESSION_TOKEN_KEYS", ""))
+_SIGNING_KEY_ID = next(iter(_KEYS), None)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(key: bytes, message: str) -> str:
+    return _b64encode(hmac.new(key, message.encode(), hashlib.sha256).digest())
+
+
+def enabled() -> bool:
+    return _SIGNING_KEY_ID is not None
+
+
+def is_signed(token: str) -> bool:
+    return token.startswith(f"{_VERSION}.")
+
+
+def issue(user_id: ObjectId) -> str:
+    assert _SIGNING_KEY_ID is not None, "SESSION_TOKEN_KEYS is not set"
+
+    payload = _b64encode(
+        json.dumps({"uid": str(user_id), "exp": int(time.time()) + _TTL}).encode()
+    )
+    message = f"{_VERSION}.{_SIGNING_KEY_ID}.{payload}"
+
+    return f"{message}.{_sign(_KEYS[_SIGNING_KEY_ID], message)}"
+
+
+def verify(token: str) -> ObjectId | None:
+    # Signed tokens are always ASCII, and compare_digest raises on other strings.
+    if not token.isascii():
+        return None
+
+    parts = token.split(".")
+
+    if len(parts) != 4 or parts[0] != _VERSION:
+        return None
+
+    _, key_id, payload, signature = parts
+
+    if key_id not in _KEYS:
+        return None
+
+    message = f"{_VERSION}.{key_id}.{payload}"
+
+    if not hmac.compare_digest(
+        signature.encode(), _sign(_KEYS[key_id], message).encode()
+    ):
+        return None
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+
+    if not isinstance(claims, dict):
+        return None
+
+    if claims.get("exp", 0) < time.time() or not ObjectId.is_valid(claims.get("uid")):
+        return None
+
+    return ObjectId(claims["uid"])
@@ -1,24 +1,95 @@
+from datetime import datetime, timezone
+
 from pydantic import BaseModel, ConfigDict
+from pymongo import IndexModel
 
 from api.schemas.objectid import PyObjectId
+from api.schemas.user import UserData
+from api.schemas.utc_datetime import UTCDatetime
 
+from . import users
+from .cache import TTLCache
 from .client import db
 
 
 class AuthToken(BaseModel):
     secret: str
     user_id: PyObjectId
+    expires_at: UTCDatetime | None = None
 
     model_config = ConfigDict(populate_by_name=True)
 
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= datetime.now(
+            timezone.utc
+        )
+
 
 auth_tokens = db.auth_tokens
 
+indexes = [
+    IndexModel([("secret", 1)], name="secret", unique=True),
+    IndexModel([("expires_at", 1)], name="expires_at", expireAfterSeconds=0),
+]
+
+query_shapes = [{"secret": ""}]
+
 
 async def create(auth_token: AuthToken):
     await auth_tokens.insert_one(auth_token.model_dump())
 
 
+_cache: TTLCache[str, AuthToken] = TTLCache()
+
+
 async def get(secret: str):
+    if cached := _cache.get(secret):
+        return None if cached.expired() else cached
+
     auth_token = await auth_tokens.find_one({"secret": secret})
-    return AuthToken(**auth_token) if auth_token else None
+
+    if not auth_token:
+        return None
+
+    token = AuthToken(**auth_token)
+    _cache.set(secret, token)
+    return None if token.expired() else token
+
+
+async def get_with_user(secret: str) -> tuple[AuthToken | None, UserData | None]:
+    if token := _cache.get(secret):
+        if token.expired():
+            return None, None
+
+        return token, await users.get(token.user_id)
+
+    cursor = auth_tokens.aggregate(
+        [
+            {"$match": {"secret": secret}},
+            {"$limit": 1},
+            {
+                "$lookup": {
+                    "from": users.users.name,
+                    "localField": "user_id",
+                    "foreignField": "_id",
+                    "as": "users",
+                }
+            },
+        ]
+    )
+
+    async for auth_token in cursor:
+        token = AuthToken(**auth_token)
+        _cache.set(secret, token)
+
+        if token.expired():
+            return None, None
+
+        if not auth_token["users"]:
+            return token, None
+
+        user = UserData(**auth_token["users"][0])
+        users.cache(user)
+        return token, user
+
+    return None, None
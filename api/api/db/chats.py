@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta, timezone
 
 from bson import ObjectId
+from pymongo import DESCENDING, IndexModel
 
 from api.schemas.chat import BaseChat, ChatData, ChatInfoData
 
@@ -8,6 +9,23 @@ from .client import db
 
 chats = db.chats
 
+indexes = [
+    IndexModel(
+        [("user_id", 1), ("last_updated", DESCENDING), ("_id", DESCENDING)],
+        name="user_id_last_updated",
+    ),
+]
+
+query_shapes = [
+    {"_id": ObjectId(), "user_id": ObjectId()},
+    {"user_id": ObjectId()},
+    {
+        "user_id": ObjectId(),
+        "messages": {"$size": 0},
+        "last_updated": {"$lt": datetime.now(timezone.utc)},
+    },
+]
+
 
 async def create(chat: BaseChat) -> ChatData:
     res = await chats.insert_one(chat.model_dump())
@@ -29,10 +47,47 @@ async def update_chat(chat: ChatData) -> ChatData:
     return chat
 
 
-async def get_chats(user_id: ObjectId) -> list[ChatInfoData]:
-    cursor = chats.find({"user_id": user_id})
+_EPOCH = datetime.fromtimestamp(0, timezone.utc)
+
+
+def encode_cursor(chat: ChatInfoData) -> str:
+    millis = (chat.last_updated - _EPOCH) // timedelta(milliseconds=1)
+    return f"{millis}:{chat.id}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    millis, id = cursor.split(":")
+
+    if not ObjectId.is_valid(id):
+        raise ValueError("Invalid cursor")
+
+    return _EPOCH + timedelta(milliseconds=int(millis)), ObjectId(id)
+
+
+async def get_chats(
+    user_id: ObjectId, before: str | None = None, limit: int = 50
+) -> tuple[list[ChatInfoData], str | None]:
+    query: dict = {"user_id": user_id}
+
+    if before is not None:
+        last_updated, id = decode_cursor(before)
+        query["$or"] = [
+            {"last_updated": {"$lt": last_updated}},
+            {"last_updated": last_updated, "_id": {"$lt": id}},
+        ]
+
+    cursor = (
+        chats.find(query, {"_id": 1, "agent": 1, "last_updated": 1, "unread": 1})
+        .sort([("last_updated", DESCENDING), ("_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+
+    page = [ChatInfoData(**chat) async for chat in cursor]
+
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
 
-    return [ChatInfoData(**chat) async for chat in cursor]
+    return page, None
 
 
 async def check_for_new_chats(user_id: ObjectId):
@@ -1,6 +1,7 @@
 from typing import Annotated
 
 from pydantic import BaseModel, ConfigDict, Field
+from pymongo import IndexModel
 
 from api.schemas import user
 from api.schemas.objectid import PyObjectId
@@ -24,6 +25,10 @@ class Cohort(BaseCohort):
 
 cohorts = db.cohorts
 
+indexes = [IndexModel([("secret", 1)], name="secret", unique=True)]
+
+query_shapes = [{"secret": ""}]
+
 
 async def create(cohort: BaseCohort) -> Cohort:
     await cohorts.insert_one(cohort.model_dump())
@@ -1,6 +1,7 @@
 from typing import Any, Literal, overload
 
 from bson import ObjectId
+from pymongo import IndexModel
 
 from api.schemas.conversation import (
     BaseConversation,
@@ -18,6 +19,19 @@ from .client import db
 
 conversations = db.conversations
 
+indexes = [
+    IndexModel(
+        [("user_id", 1), ("info.type", 1), ("info.level", 1)],
+        name="user_id_info_type_level",
+    ),
+]
+
+query_shapes = [
+    {"_id": ObjectId(), "user_id": ObjectId()},
+    {"user_id": ObjectId(), "info.type": "level", "info.level": 1},
+    {"user_id": ObjectId(), "info.type": "playground"},
+]
+
 
 async def get(conversation_id: ObjectId, user_id: ObjectId) -> ConversationData | None:
     conversation = await conversations.find_one(
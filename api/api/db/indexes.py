@@ -0,0 +1,105 @@
+import logging
+from typing import Any
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+from . import (
+    auth_tokens,
+    chats,
+    cohort,
+    conversations,
+    magic_links,
+    topic_cache,
+    users,
+)
+
+logger = logging.getLogger(__name__)
+
+_COLLECTIONS: list[tuple[AsyncIOMotorCollection, Any]] = [
+    (auth_tokens.auth_tokens, auth_tokens),
+    (chats.chats, chats),
+    (cohort.cohorts, cohort),
+    (conversations.conversations, conversations),
+    (magic_links.magic_links, magic_links),
+    (topic_cache.topic_cache, topic_cache),
+    (users.users, users),
+]
+
+_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _spec(index: dict) -> dict:
+    return {
+        "key": [
+            (field, int(direction)) for field, direction in dict(index["key"]).items()
+        ],
+        **{option: index[option] for option in _OPTIONS if option in index},
+    }
+
+
+async def _reconcile_collection(
+    collection: AsyncIOMotorCollection, declared: list[IndexModel]
+):
+    existing = await collection.index_information()
+
+    for index in declared:
+        document = index.document
+        name = document["name"]
+
+        if name in existing:
+            if _spec(existing[name]) == _spec(document):
+                continue
+
+            logger.info(f"Index {collection.name}.{name} changed, recreating")
+            await collection.drop_index(name)
+
+        try:
+            await collection.create_indexes([index])
+            logger.info(f"Created index {collection.name}.{name}")
+        except OperationFailure as e:
+            logger.error(f"Could not create index {collection.name}.{name}: {e}")
+
+    declared_names = {index.document["name"] for index in declared}
+    for name in existing:
+        if name != "_id_" and name not in declared_names:
+            logger.warning(f"Index {collection.name}.{name} is not declared")
+
+
+async def reconcile():
+    for collection, module in _COLLECTIONS:
+        await _reconcile_collection(collection, module.indexes)
+
+
+def _stages(plan: dict) -> list[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            stages += _stages(plan[child])
+
+    for child in plan.get("inputStages", []):
+        stages += _stages(child)
+
+    return stages
+
+
+async def report_collection_scans() -> list[tuple[str, dict]]:
+    scans = []
+
+    for collection, module in _COLLECTIONS:
+        for query in module.query_shapes:
+            try:
+                explanation = await collection.find(query).explain()
+            except OperationFailure as e:
+                logger.error(f"Could not explain {collection.name} query: {e}")
+                continue
+
+            if "COLLSCAN" in _stages(explanation["queryPlanner"]["winningPlan"]):
+                scans.append((collection.name, query))
+
+    for name, query in scans:
+        logger.warning(f"Query on {name} falls back to a collection scan: {query}")
+
+    return scans
@@ -1,6 +1,10 @@
+from datetime import datetime, timedelta, timezone
+
 from pydantic import BaseModel, ConfigDict
+from pymongo import IndexModel, ReturnDocument
 
 from api.schemas.objectid import PyObjectId
+from api.schemas.utc_datetime import UTCDatetime
 
 from .client import db
 
@@ -8,17 +12,55 @@ from .client import db
 class MagicLink(BaseModel):
     secret: str
     user_id: PyObjectId | None
+    expires_at: UTCDatetime | None = None
+    redeemed_at: UTCDatetime | None = None
 
     model_config = ConfigDict(populate_by_name=True)
 
 
 magic_links = db.magic_links
 
+indexes = [
+    IndexModel([("secret", 1)], name="secret", unique=True),
+    IndexModel([("expires_at", 1)], name="expires_at", expireAfterSeconds=0),
+]
+
+query_shapes = [{"secret": ""}]
+
 
 async def create(magic_link: MagicLink):
     await magic_links.insert_one(magic_link.model_dump())
 
 
+async def create_many(new_magic_links: list[MagicLink]):
+    await magic_links.insert_many([link.model_dump() for link in new_magic_links])
+
+
 async def get(secret: str):
     magic_link = await magic_links.find_one({"secret": secret})
     return MagicLink(**magic_link) if magic_link else None
+
+
+# A link can be redeemed again within grace of its first redemption, e.g. on a
+# second device, until it expires.
+async def redeem(secret: str, grace: timedelta) -> MagicLink | None:
+    now = datetime.now(timezone.utc)
+
+    magic_link = await magic_links.find_one_and_update(
+        {
+            "secret": secret,
+            "$and": [
+                {"$or": [{"expires_at": None}, {"expires_at": {"$gt": now}}]},
+                {
+                    "$or": [
+                        {"redeemed_at": None},
+                        {"redeemed_at": {"$gt": now - grace}},
+                    ]
+                },
+            ],
+        },
+        [{"$set": {"redeemed_at": {"$ifNull": ["$redeemed_at", now]}}}],
+        return_document=ReturnDocument.AFTER,
+    )
+
+    return MagicLink(**magic_link) if magic_link else None
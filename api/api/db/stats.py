@@ -0,0 +1,39 @@
+import asyncio
+import logging
+import os
+
+from .client import db
+
+logger = logging.getLogger(__name__)
+
+_REPORT_INTERVAL = float(os.getenv("COLLECTION_STATS_INTERVAL_SECONDS", "3600"))
+
+_COLLECTIONS = ["auth_tokens", "magic_links", "users", "cohorts", "chats"]
+
+
+async def collection_sizes() -> dict[str, dict[str, int]]:
+    sizes = {}
+
+    for name in _COLLECTIONS:
+        stats = await db.command("collStats", name)
+        sizes[name] = {
+            "count": stats.get("count", 0),
+            "size": stats.get("size", 0),
+            "index_size": stats.get("totalIndexSize", 0),
+        }
+
+    return sizes
+
+
+async def report_collection_sizes():
+    while True:
+        try:
+            for name, size in (await collection_sizes()).items():
+                logger.info(
+                    f"Collection {name}: {size['count']} documents, "
+                    f"{size['size']} bytes, {size['index_size']} bytes of indexes"
+                )
+        except Exception as e:
+            logger.warning(f"Could not collect collection sizes: {e}")
+
+        await asyncio.sleep(_REPORT_INTERVAL)
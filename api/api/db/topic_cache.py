@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
+from pymongo import IndexModel
+
+from api.schemas.utc_datetime import UTCDatetime
+
+from .client import db
+
+
+class CachedTopic(BaseModel):
+    topic: str
+    embedding: list[float] | None
+    introduction: str
+    scenario: str
+    last_used: UTCDatetime
+
+    model_config = ConfigDict(populate_by_name=True)
+
+
+topic_cache = db.topic_cache
+
+indexes = [IndexModel([("topic", 1)], name="topic", unique=True)]
+
+query_shapes = [{"topic": ""}]
+
+
+async def get_all() -> list[CachedTopic]:
+    return [CachedTopic(**entry) async for entry in topic_cache.find()]
+
+
+async def upsert(entry: CachedTopic):
+    await topic_cache.update_one(
+        {"topic": entry.topic}, {"$set": entry.model_dump()}, upsert=True
+    )
+
+
+async def touch(topic: str, last_used: datetime):
+    await topic_cache.update_one({"topic": topic}, {"$set": {"last_used": last_used}})
+
+
+async def delete(topic: str):
+    await topic_cache.delete_one({"topic": topic})
@@ -1,16 +1,46 @@
 from bson import ObjectId
+from pymongo import IndexModel
 
 from api.schemas.conversation import ConversationStage
 from api.schemas.user import BaseUserData, UserData
 
+from .cache import TTLCache
 from .client import db
 
 users = db.users
 
+indexes: list[IndexModel] = []
+
+query_shapes = [{"_id": ObjectId()}]
+
+_cache: TTLCache[ObjectId, UserData] = TTLCache()
+
+
+# Users that have not registered yet are not cached, as registration may be
+# handled by another instance that cannot invalidate this one.
+def cache(user: UserData):
+    if user.name is None or user.personalization is None:
+        return
+
+    _cache.set(user.id, user.model_copy(deep=True))
+
+
+def invalidate(id: ObjectId):
+    _cache.invalidate(id)
+
 
 async def get(id: ObjectId):
+    if cached := _cache.get(id):
+        return cached.model_copy(deep=True)
+
     user = await users.find_one({"_id": id})
-    return UserData(**user) if user else None
+
+    if not user:
+        return None
+
+    user = UserData(**user)
+    cache(user)
+    return user
 
 
 async def create(user: BaseUserData) -> UserData:
@@ -19,10 +49,20 @@ async def create(user: BaseUserData) -> UserData:
     return UserData(id=res.inserted_id, **user.model_dump())
 
 
+async def create_many(new_users: list[BaseUserData]) -> list[UserData]:
+    res = await users.insert_many([user.model_dump() for user in new_users])
+
+    return [
+        UserData(id=id, **user.model_dump())
+        for id, user in zip(res.inserted_ids, new_users, strict=True)
+    ]
+
+
 async def update(user_id: ObjectId, user: UserData):
     raw_user = await users.find_one_and_update(
         {"_id": user_id}, {"$set": user.model_dump()}, return_document=True
     )
+    invalidate(user_id)
 
     return UserData(**raw_user)
 
@@ -44,3 +84,4 @@ async def unlock_stage(user_id: ObjectId, stage: ConversationStage):
     await users.update_one(
         {"_id": user_id}, {"$set": {"max_unlocked_stage": stage.model_dump()}}
     )
+    invalidate(user_id)
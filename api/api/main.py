@@ -1,8 +1,11 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from .db import indexes, stats
 from .routers import auth, conversations
 
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +17,17 @@ origins = [
     "https://dev.autsim.pages.dev",
 ]
 
-app = FastAPI(title="Autsim API", version="0.0.1", debug=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await indexes.reconcile()
+    await indexes.report_collection_scans()
+    size_reporter = asyncio.create_task(stats.report_collection_sizes())
+    yield
+    size_reporter.cancel()
+
+
+app = FastAPI(title="Autsim API", version="0.0.1", debug=True, lifespan=lifespan)
 
 
 app.add_middleware(
@@ -1,16 +1,22 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from api.auth.deps import CurrentInternalAuth, CurrentUser, CurrentUserID
 from api.schemas.chat import Options
+from api.schemas.objectid import PyObjectId
 from api.schemas.user import User, UserPersonalizationOptions, user_from_data
 from api.services.auth import (
     AlreadyInitialized,
     InvalidMagicLink,
     LoginResult,
+    UserNotFound,
     create_magic_link,
+    create_magic_links,
     init_user,
     login_user,
+    provision_chats,
+    reissue_magic_link,
 )
 from api.services.cohort import InvalidCohortToken, create_cohort, create_user
 
@@ -31,10 +37,13 @@ async def exchange(options: LoginOptions) -> LoginResult:
 
 @router.post("/register", responses={400: {"description": "User already initialized"}})
 async def setup(
-    current_user_id: CurrentUserID, options: UserPersonalizationOptions
+    current_user_id: CurrentUserID,
+    options: UserPersonalizationOptions,
+    background_tasks: BackgroundTasks,
 ) -> User:
     try:
         user = await init_user(current_user_id, options)
+        background_tasks.add_task(provision_chats, user)
         return user_from_data(user)
     except AlreadyInitialized as e:
         raise HTTPException(status_code=400, detail="User already initialized") from e
@@ -52,6 +61,44 @@ async def internal_create_magic_link(
     return await create_magic_link(init_chats)
 
 
+class ReissueMagicLinkOptions(BaseModel):
+    user_id: PyObjectId | None = None
+    magic_link: str | None = None
+
+
+@router.post(
+    "/internal-reissue-magic-link",
+    responses={404: {"description": "User not found"}},
+)
+async def internal_reissue_magic_link(
+    _: CurrentInternalAuth, options: ReissueMagicLinkOptions
+) -> str:
+    try:
+        return await reissue_magic_link(options.user_id, options.magic_link)
+    except UserNotFound as e:
+        raise HTTPException(status_code=404, detail="User not found") from e
+
+
+class CreateMagicLinksOptions(BaseModel):
+    count: int = Field(gt=0, le=10000)
+    init_chats: list[Options]
+
+
+@router.post(
+    "/internal-create-magic-links",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/plain": {}}}},
+)
+async def internal_create_magic_links(
+    _: CurrentInternalAuth, options: CreateMagicLinksOptions
+):
+    async def lines():
+        async for secret in create_magic_links(options.count, options.init_chats):
+            yield secret + "\n"
+
+    return StreamingResponse(lines(), media_type="text/plain")
+
+
 class CreateCohortOptions(BaseModel):
     name: str
     init_chats: list[Options]
@@ -2,15 +2,18 @@ import secrets
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
 
-from api.db import auth_tokens, users
+from api.auth.deps import authenticate
+from api.schemas.chat import chat_version_map_adapter
 from api.schemas.conversation import (
     ConversationStage,
     ConversationStageStr,
     conversation_stage_from_str,
 )
 from api.services import websocket_handler
-from api.services.connection_manager import Connections
+from api.services.chat_socket import ChatSocket, negotiate_encoding
+from api.services.connection_manager import connections
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
@@ -25,8 +28,6 @@ ConversationStageFromQuery = Annotated[
     ConversationStage, Depends(_get_conversation_stage)
 ]
 
-connections = Connections()
-
 
 @router.websocket("/ws")
 async def ws_endpoint(
@@ -39,29 +40,52 @@ async def ws_endpoint(
 
         credentials = await ws.receive_json()
 
-        token = await auth_tokens.get(credentials["token"])
+        user_id, user = await authenticate(credentials["token"])
 
-        if not token:
+        if not user_id:
             await ws.send_json({"error": "Invalid token"})
             await ws.close()
             return
 
-        user_id = token.user_id
-
-        user = await users.get(user_id)
-
         if not user:
             await ws.send_json({"error": "User not found"})
             await ws.close()
             return
 
-        await ws.send_json({"type": "connected", "connection_id": connection_id})
+        try:
+            resume_versions = chat_version_map_adapter.validate_python(
+                credentials.get("versions", {})
+            )
+        except ValidationError:
+            await ws.send_json({"error": "Invalid versions"})
+            await ws.close()
+            return
 
         connection_manager = connections.get(user_id)
 
+        versions = None
+        if "connection_id" in credentials and connection_manager.resume(
+            credentials["connection_id"]
+        ):
+            connection_id = credentials["connection_id"]
+            versions = resume_versions
+
+        encoding = negotiate_encoding(credentials.get("encoding"))
+
+        await ws.send_json(
+            {
+                "type": "connected",
+                "connection_id": connection_id,
+                "resumed": versions is not None,
+                "encoding": encoding,
+            }
+        )
+
         await websocket_handler.handle_connection(
-            ws, connection_manager, connection_id, user
+            ChatSocket(ws, encoding), connection_manager, connection_id, user, versions
         )
     except WebSocketDisconnect:
+        pass
+    finally:
         if connection_manager:
             connection_manager.close(connection_id)
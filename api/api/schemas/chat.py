@@ -7,6 +7,8 @@ from api.schemas.utc_datetime import UTCDatetime
 
 from .objectid import PyObjectId
 
+VariationStrategy = Literal["sequential", "fused", "race"]
+
 
 class Options(BaseModel):
     feedback_mode: Literal["on-suggestion", "on-submit"] = "on-submit"
@@ -23,6 +25,9 @@ class Options(BaseModel):
         Field(min_length=1, max_length=4),
     ] = ["non-literal-emoji", "non-literal-figurative", "yes-no-question", "blunt"]
     gap: bool = False
+    speculative_replies: bool = False
+    variation_strategy: VariationStrategy = "sequential"
+    suggestion_feedback: Literal["eager", "lazy"] = "lazy"
 
 
 default_options = Options(
@@ -43,6 +48,7 @@ class ChatMessage(BaseModel):
 
 class InChatFeedback(BaseModel):
     feedback: Feedback
+    objective: str | None = None
     alternative: str | None = None
     alternative_feedback: str | None = None
     created_at: UTCDatetime
@@ -146,3 +152,11 @@ class ChatInfo(BaseModel):
 
 
 chat_info_list_adapter = TypeAdapter(list[ChatInfo])
+
+
+class ChatVersion(BaseModel):
+    epoch: str
+    version: int
+
+
+chat_version_map_adapter = TypeAdapter(dict[PyObjectId, ChatVersion])
@@ -0,0 +1,96 @@
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field, TypeAdapter
+
+from .objectid import PyObjectId
+
+
+class BaseClientEvent(BaseModel):
+    request_id: str | None = None
+
+
+class CreateChatEvent(BaseClientEvent):
+    type: Literal["create-chat"] = "create-chat"
+
+
+class LoadChatsEvent(BaseClientEvent):
+    type: Literal["load-chats"] = "load-chats"
+    before: str
+
+
+class LoadChatEvent(BaseClientEvent):
+    type: Literal["load-chat"] = "load-chat"
+    id: PyObjectId
+
+
+class SuggestMessagesEvent(BaseClientEvent):
+    type: Literal["suggest-messages"] = "suggest-messages"
+    id: PyObjectId
+    message: str
+
+
+class DraftEvent(BaseClientEvent):
+    type: Literal["draft"] = "draft"
+    id: PyObjectId
+    message: str
+    variations: bool = False
+
+
+class SendMessageEvent(BaseClientEvent):
+    type: Literal["send-message"] = "send-message"
+    id: PyObjectId
+    index: Annotated[int, Field(ge=0)]
+
+
+class MarkReadEvent(BaseClientEvent):
+    type: Literal["mark-read"] = "mark-read"
+    id: PyObjectId
+
+
+class RateFeedbackEvent(BaseClientEvent):
+    type: Literal["rate-feedback"] = "rate-feedback"
+    id: PyObjectId
+    index: int
+    rating: int
+
+
+class ViewSuggestionEvent(BaseClientEvent):
+    type: Literal["view-suggestion"] = "view-suggestion"
+    id: PyObjectId
+    index: int
+
+
+class PrefetchFeedbackEvent(BaseClientEvent):
+    type: Literal["prefetch-feedback"] = "prefetch-feedback"
+    id: PyObjectId
+    index: int
+
+
+class CheckpointRatingEvent(BaseClientEvent):
+    type: Literal["checkpoint-rating"] = "checkpoint-rating"
+    id: PyObjectId
+    ratings: dict[str, int]
+
+
+class IntroductionSeenEvent(BaseClientEvent):
+    type: Literal["introduction-seen"] = "introduction-seen"
+    id: PyObjectId
+
+
+ClientEvent = Annotated[
+    CreateChatEvent
+    | LoadChatsEvent
+    | LoadChatEvent
+    | SuggestMessagesEvent
+    | DraftEvent
+    | SendMessageEvent
+    | MarkReadEvent
+    | RateFeedbackEvent
+    | ViewSuggestionEvent
+    | PrefetchFeedbackEvent
+    | CheckpointRatingEvent
+    | IntroductionSeenEvent,
+    Field(discriminator="type"),
+]
+
+client_event_adapter = TypeAdapter(ClientEvent)
@@ -1,11 +1,18 @@
+import asyncio
+import logging
+import os
 import secrets
+from collections.abc import AsyncIterator
+from datetime import datetime, timedelta, timezone
 
 from bson import ObjectId
 from pydantic import BaseModel
 
+from api.auth import session_tokens
 from api.db import auth_tokens, magic_links
 from api.db import users as users
 from api.schemas import user
+from api.schemas.chat import Options
 from api.schemas.user import (
     BaseUserData,
     User,
@@ -14,6 +21,20 @@ from api.schemas.user import (
     user_from_data,
 )
 from api.services import chat_service
+from api.services.connection_manager import connections
+
+logger = logging.getLogger(__name__)
+
+_AUTH_TOKEN_TTL = timedelta(
+    seconds=int(os.getenv("AUTH_TOKEN_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+)
+_MAGIC_LINK_TTL = timedelta(
+    seconds=int(os.getenv("MAGIC_LINK_TTL_SECONDS", str(14 * 24 * 60 * 60)))
+)
+_MAGIC_LINK_REDEEM_GRACE = timedelta(
+    seconds=int(os.getenv("MAGIC_LINK_REDEEM_GRACE_SECONDS", str(60 * 60)))
+)
+_MAGIC_LINK_BATCH_SIZE = int(os.getenv("MAGIC_LINK_BATCH_SIZE", "200"))
 
 
 class LoginResult(BaseModel):
@@ -22,8 +43,15 @@ class LoginResult(BaseModel):
 
 
 async def _create_auth_token(user_id: ObjectId) -> str:
+    if session_tokens.enabled():
+        return session_tokens.issue(user_id)
+
     secret = secrets.token_urlsafe(16)
-    token = auth_tokens.AuthToken(secret=secret, user_id=user_id)
+    token = auth_tokens.AuthToken(
+        secret=secret,
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + _AUTH_TOKEN_TTL,
+    )
     await auth_tokens.create(token)
     return token.secret
 
@@ -37,7 +65,7 @@ class NeedsSetup(Exception):
 
 
 async def login_user(secret: str) -> LoginResult:
-    link = await magic_links.get(secret)
+    link = await magic_links.redeem(secret, _MAGIC_LINK_REDEEM_GRACE)
 
     if not link:
         raise InvalidMagicLink()
@@ -62,12 +90,73 @@ async def create_magic_link(
 
     user = await users.create(BaseUserData(init_chats=init_chats, cohort=cohort_id))
 
-    link = magic_links.MagicLink(secret=secret, user_id=user.id)
+    link = magic_links.MagicLink(
+        secret=secret,
+        user_id=user.id,
+        expires_at=datetime.now(timezone.utc) + _MAGIC_LINK_TTL,
+    )
     await magic_links.create(link)
 
     return link.secret
 
 
+class UserNotFound(Exception):
+    pass
+
+
+# Issues a new link for an existing user, found by id or by a previous link that
+# has not expired yet.
+async def reissue_magic_link(
+    user_id: ObjectId | None = None, previous_secret: str | None = None
+) -> str:
+    if (
+        user_id is None
+        and previous_secret is not None
+        and (previous := await magic_links.get(previous_secret))
+    ):
+        user_id = previous.user_id
+
+    if user_id is None or not await users.get(user_id):
+        raise UserNotFound()
+
+    link = magic_links.MagicLink(
+        secret=secrets.token_urlsafe(16),
+        user_id=user_id,
+        expires_at=datetime.now(timezone.utc) + _MAGIC_LINK_TTL,
+    )
+    await magic_links.create(link)
+
+    return link.secret
+
+
+async def create_magic_links(
+    count: int, init_chats: list[user.Options], cohort_id: ObjectId | None = None
+) -> AsyncIterator[str]:
+    for start in range(0, count, _MAGIC_LINK_BATCH_SIZE):
+        batch_size = min(_MAGIC_LINK_BATCH_SIZE, count - start)
+
+        created = await users.create_many(
+            [
+                BaseUserData(init_chats=init_chats, cohort=cohort_id)
+                for _ in range(batch_size)
+            ]
+        )
+
+        expires_at = datetime.now(timezone.utc) + _MAGIC_LINK_TTL
+        links = [
+            magic_links.MagicLink(
+                secret=secrets.token_urlsafe(16),
+                user_id=created_user.id,
+                expires_at=expires_at,
+            )
+            for created_user in created
+        ]
+        await magic_links.create_many(links)
+
+        for link in links:
+            yield link.secret
+
+
 class AlreadyInitialized(Exception):
     pass
 
@@ -83,9 +172,23 @@ async def init_user(
     user.name = personalization.name
     user.personalization = personalization
 
-    user = await users.update(user_id, user)
+    return await users.update(user_id, user)
+
+
+async def provision_chats(user: UserData):
+    connection = connections.get(user.id)
+    connection.set_provisioning(len(user.init_chats))
+
+    async def provision(options: Options):
+        try:
+            chat = await chat_service.create_chat(user, options)
+            connection.publish_state(chat_service.ChatState(chat))
+        except Exception:
+            logger.exception(f"Failed to provision chat for user {user.id}")
+        finally:
+            connection.set_provisioning(connection.provisioning - 1)
 
-    for options in user.init_chats:
-        await chat_service.create_chat(user, options)
+    await asyncio.gather(*(provision(options) for options in user.init_chats))
 
-    return user
+    # create_chat updates the options in init_chats; save them all at once.
+    await users.update(user.id, user)
@@ -3,6 +3,48 @@ from api.schemas.user import UserPersonalizationOptions
 from api.services import generate_suggestions, message_generation
 
 
+def state_after_objective(chat: ChatData) -> str:
+    return (
+        "no-objective"
+        if chat.options.gap
+        or (
+            len(chat.objectives_used) >= len(generate_suggestions.ALL_OBJECTIVES)
+            and "blunt" in chat.options.enabled_objectives
+        )
+        else "objective"
+    )
+
+
+def next_state(chat: ChatData, objective: str | None) -> tuple[str, str | None]:
+    state = None
+    match (chat.state, chat.options.feedback_mode):
+        case ("no-objective", _):
+            state = (
+                "objective"
+                if len(chat.messages) > 2
+                and len(generate_suggestions.ALL_OBJECTIVES) > 0
+                else "no-objective"
+            )
+        case ("objective" | "objective-blunt", "on-suggestion"):
+            state = state_after_objective(chat)
+        case ("objective" | "objective-blunt", "on-submit"):
+            state = "react"
+        case ("react", _):
+            state = state_after_objective(chat)
+
+    assert state is not None
+
+    if (
+        "blunt" not in chat.objectives_used
+        and len(chat.messages) > 3
+        and len(chat.objectives_used) >= len(generate_suggestions.ALL_OBJECTIVES)
+        and chat.state == "no-objective"
+    ):
+        return "objective-blunt", "blunt-initial"
+
+    return state, objective
+
+
 async def generate_agent_message(
     pers: UserPersonalizationOptions,
     chat: ChatData,
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict, deque
+from typing import NamedTuple
+
+import numpy as np
+
+from api.services import rate_limit
+from api.services.topic_cache import normalize_topic, topic_cache
+from api.services.topic_generation import (
+    generate_scenario_message,
+    generate_topic_message,
+)
+
+logger = logging.getLogger(__name__)
+
+_POOL_SIZE = int(os.getenv("CHAT_POOL_SIZE", "3"))
+_POOL_MAX_TOPICS = int(os.getenv("CHAT_POOL_MAX_TOPICS", "100"))
+_REFILL_MAX_BACKLOG = int(os.getenv("CHAT_POOL_REFILL_MAX_BACKLOG", "8"))
+_REFILL_INTERVAL = float(os.getenv("CHAT_POOL_REFILL_INTERVAL_SECONDS", "5"))
+_REFILL_MIN_CLAIMS = int(os.getenv("CHAT_POOL_REFILL_MIN_CLAIMS", "2"))
+_GENERATE_ATTEMPTS = 3
+
+# Used for chats that are not inspired by the user's topic, so it is always
+# worth keeping a pool of.
+DEFAULT_TOPIC = "astronomy"
+
+# Pooled messages are generated for placeholder names that are substituted with
+# the real ones when a chat is claimed. The prompts avoid gendered pronouns so
+# that the text fits whoever the names are replaced with.
+_AGENT_PLACEHOLDER = "Zorvani"
+_USER_PLACEHOLDER = "Quillet"
+
+
+class PooledChat(NamedTuple):
+    introduction: str
+    scenario: str
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+# Whether every placeholder appears, and only verbatim: a placeholder the model
+# declined or changed (e.g. "Zorvanis") would not be substituted.
+def _has_placeholders(text: str, placeholders: list[str]) -> bool:
+    for placeholder in placeholders:
+        words = re.findall(rf"\w*{placeholder[:-1]}\w*", text, re.IGNORECASE)
+        if not words or any(word != placeholder for word in words):
+            return False
+
+    return True
+
+
+def _is_valid(pooled: PooledChat) -> bool:
+    return _has_placeholders(
+        pooled.introduction, [_AGENT_PLACEHOLDER]
+    ) and _has_placeholders(pooled.scenario, [_USER_PLACEHOLDER, _AGENT_PLACEHOLDER])
+
+
+async def generate(topic: str, embedding: np.ndarray | None = None) -> PooledChat:
+    for attempt in range(_GENERATE_ATTEMPTS):
+        pooled = PooledChat(
+            *await asyncio.gather(
+                generate_topic_message(_AGENT_PLACEHOLDER, topic),
+                generate_scenario_message(_USER_PLACEHOLDER, _AGENT_PLACEHOLDER, topic),
+            )
+        )
+
+        if _is_valid(pooled):
+            break
+
+        logger.warning(
+            f"Generated chat for {topic!r} did not keep the placeholder names "
+            f"(attempt {attempt + 1})"
+        )
+    else:
+        raise ValueError(f"Could not generate a chat for {topic!r} with placeholders")
+
+    task = asyncio.create_task(
+        _remember(topic, pooled.introduction, pooled.scenario, embedding)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    return pooled
+
+
+async def _remember(
+    topic: str, introduction: str, scenario: str, embedding: np.ndarray | None
+):
+    try:
+        await topic_cache.put(topic, introduction, scenario, embedding)
+    except Exception:
+        logger.exception(f"Failed to cache introduction for {topic!r}")
+
+
+async def _cached_or_generate(topic: str) -> PooledChat:
+    cached, embedding = await topic_cache.get(topic)
+    if cached:
+        pooled = PooledChat(cached.introduction, cached.scenario)
+        if _is_valid(pooled):
+            return pooled
+
+    return await generate(topic, embedding)
+
+
+def _substitute(text: str, user: str, agent: str) -> str:
+    return text.replace(_AGENT_PLACEHOLDER, agent).replace(_USER_PLACEHOLDER, user)
+
+
+class ChatPool:
+    def __init__(self, size: int, max_topics: int):
+        self._size = size
+        self._max_topics = max_topics
+        self._pools: OrderedDict[str, deque[PooledChat]] = OrderedDict()
+        self._refills: dict[str, asyncio.Task] = {}
+        # The topic as last requested for each key, which is what is generated.
+        self._topics: dict[str, str] = {}
+        self._claims: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self) -> float:
+        claims = self.hits + self.misses
+        return self.hits / claims if claims else 0
+
+    def _pool(self, topic: str) -> deque[PooledChat]:
+        if topic not in self._pools:
+            self._pools[topic] = deque()
+
+            while len(self._pools) > self._max_topics:
+                evicted, _ = self._pools.popitem(last=False)
+                self._topics.pop(evicted, None)
+                self._claims.pop(evicted, None)
+                if refill := self._refills.pop(evicted, None):
+                    refill.cancel()
+
+        self._pools.move_to_end(topic)
+        return self._pools[topic]
+
+    async def claim(self, user: str, agent: str, topic: str) -> PooledChat:
+        key = normalize_topic(topic)
+        pool = self._pool(key)
+        self._topics[key] = topic
+        self._claims[key] = self._claims.get(key, 0) + 1
+        pooled = pool.popleft() if pool else None
+        self._schedule_refill(key)
+
+        if pooled is None:
+            self.misses += 1
+            logger.info(f"Chat pool miss for {key!r} (hit rate {self.hit_rate():.0%})")
+            pooled = await _cached_or_generate(topic)
+        else:
+            self.hits += 1
+
+        return PooledChat(
+            _substitute(pooled.introduction, user, agent),
+            _substitute(pooled.scenario, user, agent),
+        )
+
+    # Most topics are only requested once, so only those with repeat demand are
+    # worth generating ahead of time.
+    def _schedule_refill(self, key: str):
+        if self._claims[key] < _REFILL_MIN_CLAIMS and key != normalize_topic(
+            DEFAULT_TOPIC
+        ):
+            return
+
+        if self._size > 0 and key not in self._refills:
+            self._refills[key] = asyncio.create_task(self._refill(key))
+
+    async def _refill(self, key: str):
+        try:
+            while key in self._pools and len(self._pools[key]) < self._size:
+                # Only use spare LLM capacity; user-facing requests go first.
+                if rate_limit.admission.backlog() > _REFILL_MAX_BACKLOG:
+                    await asyncio.sleep(_REFILL_INTERVAL)
+                    continue
+
+                async with rate_limit.admission.request(
+                    rate_limit.EVENT_COSTS["create-chat"]
+                ):
+                    pooled = await generate(self._topics[key])
+
+                if key in self._pools:
+                    self._pools[key].append(pooled)
+        except rate_limit.AdmissionRejected:
+            pass
+        except Exception:
+            logger.exception(f"Failed to refill chat pool for {key!r}")
+        finally:
+            if self._refills.get(key) is asyncio.current_task():
+                del self._refills[key]
+
+
+chat_pool = ChatPool(_POOL_SIZE, _POOL_MAX_TOPICS)
@@ -1,5 +1,8 @@
 import asyncio
+import os
 import random
+import secrets
+from collections import deque
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
@@ -8,29 +11,31 @@ from typing import Callable
 import faker
 from bson import ObjectId
 
-from api.db import chats, users
+from api.db import chats
 from api.schemas.chat import (
     BaseChat,
+    ChatApi,
     ChatData,
     ChatEvent,
     ChatInfo,
     ChatMessage,
+    Feedback,
     InChatFeedback,
     Options,
     Suggestion,
     suggestion_list_adapter,
 )
-from api.schemas.user import UserData
+from api.schemas.user import UserData, UserPersonalizationOptions
 from api.services import (
     chat_generation,
+    drafts,
     generate_feedback,
     generate_suggestions,
     message_generation,
+    pipeline,
+    speculation,
 )
-from api.services.topic_generation import (
-    generate_scenario_message,
-    generate_topic_message,
-)
+from api.services.chat_pool import DEFAULT_TOPIC, chat_pool
 
 _fake = faker.Faker()
 
@@ -42,7 +47,7 @@ async def create_chat(user: UserData, options: Options | None = None) -> ChatDat
     topic = (
         user.personalization.topic
         if options.suggestion_generation == "content-inspired" and user.personalization
-        else "astronomy"
+        else DEFAULT_TOPIC
     )
 
     agent = None
@@ -51,8 +56,7 @@ async def create_chat(user: UserData, options: Options | None = None) -> ChatDat
         agent = _fake.first_name()
 
     assert user.name is not None
-    introduction = await generate_topic_message(agent, topic)
-    scenario = await generate_scenario_message(user.name, agent, topic)
+    introduction, scenario = await chat_pool.claim(user.name, agent, topic)
 
     base_chat = BaseChat(
         user_id=user.id,
@@ -68,23 +72,20 @@ async def create_chat(user: UserData, options: Options | None = None) -> ChatDat
         scenario=scenario,
     )
 
-    chat = await chats.create(base_chat)
-
     if options.suggestion_generation == "random":
-        chat.suggestions = [
+        base_chat.suggestions = [
             Suggestion(message="Hello!", objective=None),
-            Suggestion(message=f"Hi {chat.agent}, how are you?", objective=None),
+            Suggestion(message=f"Hi {agent}, how are you?", objective=None),
             Suggestion(message="Hey!", objective=None),
         ]
 
-    await chats.update_chat(chat)
+    chat = await chats.create(base_chat)
 
+    # Options taken from init_chats are stored on the user by the caller.
     options.suggestion_generation = (
         "content-inspired" if options.suggestion_generation == "random" else "random"
     )
 
-    await users.update(user.id, user)
-
     return chat
 
 
@@ -96,8 +97,17 @@ async def update_chat(chat: ChatData) -> ChatData:
     return await chats.update_chat(chat)
 
 
-async def get_chats(user_id: ObjectId) -> list[ChatInfo]:
-    return [ChatInfo.from_data(chat) for chat in await chats.get_chats(user_id)]
+_CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))
+
+
+async def get_chats(
+    user_id: ObjectId, before: str | None = None
+) -> tuple[list[ChatInfo], str | None]:
+    page, next_cursor = await chats.get_chats(user_id, before, _CHAT_PAGE_SIZE)
+    return [ChatInfo.from_data(chat) for chat in page], next_cursor
+
+
+_CHANGE_LOG_SIZE = int(os.getenv("CHAT_CHANGE_LOG_SIZE", "64"))
 
 
 class ChatState:
@@ -106,6 +116,16 @@ class ChatState:
         self._lock = asyncio.Lock()
         self._changed = asyncio.Event()
         self.id = chat.id
+        self.epoch = secrets.token_hex(8)
+        self.version = 0
+        # Only the latest snapshot is kept; the change log records which keys
+        # changed in each version, and patches are built from the snapshot.
+        self._snapshot = self._dump()
+        self._changes: deque[tuple[int, set[str]]] = deque(maxlen=_CHANGE_LOG_SIZE)
+        self.alternative_feedback_requests: dict[int, asyncio.Task[str]] = {}
+        self.feedback_requests: dict[
+            int, tuple[list[Suggestion], asyncio.Task[Feedback]]
+        ] = {}
 
     async def wait_for_change(self):
         await self._changed.wait()
@@ -114,9 +134,39 @@ class ChatState:
     def read(self) -> ChatData:
         return self._chat
 
+    def _dump(self) -> dict:
+        return ChatApi.from_data(self._chat).model_dump(mode="json")
+
     def mark_changed(self):
+        snapshot = self._dump()
+        changed = {
+            key for key, value in snapshot.items() if self._snapshot.get(key) != value
+        }
+
+        if changed:
+            self.version += 1
+            self._changes.append((self.version, changed))
+            self._snapshot = snapshot
+
         self._changed.set()
 
+    def changes_since(self, epoch: str, version: int) -> dict | None:
+        if epoch != self.epoch:
+            return None
+
+        if version == self.version:
+            return {}
+
+        if version > self.version or not self._changes:
+            return None
+
+        if self._changes[0][0] > version + 1:
+            return None
+
+        changed = set().union(*(keys for v, keys in self._changes if v > version))
+
+        return {key: self._snapshot[key] for key in changed}
+
     @asynccontextmanager
     async def transaction(
         self,
@@ -131,243 +181,191 @@ class ChatState:
         await update_chat(self._chat)
 
 
-async def _generate_agent_message(
-    chat_state: ChatState,
-    user: UserData,
-    objective: str | None = None,
-    problem: str | None = None,
+def _add_react_steps(
+    turn: pipeline.Pipeline,
+    chat: ChatData,
+    mark_changed: Callable[[], None],
+    pers: UserPersonalizationOptions,
+    objective: str | None,
+    problem: str | None,
 ):
-    async with chat_state.transaction() as (chat, mark_changed):
-        assert user.personalization
-        pers = message_generation.get_personalization_options(
-            user.personalization,
-            chat.options.suggestion_generation == "content-inspired",
+    assert isinstance(chat.messages[-1], ChatMessage)
+    assert chat.last_suggestions is not None
+    assert objective is not None
+
+    message = chat.messages[-1].content
+    last3 = (
+        chat.messages[-2].content
+        if len(chat.messages) > 1 and isinstance(chat.messages[-2], ChatMessage)
+        else None
+    )
+    last_suggestions = chat.last_suggestions
+
+    def context() -> str:
+        return message_generation.format_messages_context_short(
+            chat.messages, chat.agent
         )
-        chat.agent_typing = True
-        mark_changed()
 
-        next_state = None
-        match (chat.state, chat.options.feedback_mode):
-            case ("no-objective", _):
-                next_state = (
-                    "objective"
-                    if len(chat.messages) > 2
-                    and len(generate_suggestions.ALL_OBJECTIVES) > 0
-                    else "no-objective"
-                )
-            case ("objective" | "objective-blunt", "on-suggestion"):
-                next_state = (
-                    "no-objective"
-                    if chat.options.gap
-                    or (
-                        len(chat.objectives_used)
-                        >= len(generate_suggestions.ALL_OBJECTIVES)
-                        and "blunt" in chat.options.enabled_objectives
-                    )
-                    else "objective"
-                )
-            case ("objective" | "objective-blunt", "on-submit"):
-                next_state = "react"
-            case ("react", _):
-                next_state = (
-                    "no-objective"
-                    if chat.options.gap
-                    or (
-                        len(chat.objectives_used)
-                        >= len(generate_suggestions.ALL_OBJECTIVES)
-                        and "blunt" in chat.options.enabled_objectives
-                    )
-                    else "objective"
-                )
+    alternative = (
+        next(filter(lambda s: s.problem is None, last_suggestions)) if problem else None
+    )
+    # Partial feedback is streamed into this message until the final one is
+    # published.
+    pending: InChatFeedback | None = None
+
+    def show_feedback(feedback: Feedback):
+        nonlocal pending
+
+        if pending is None:
+            pending = InChatFeedback(
+                feedback=feedback,
+                objective=objective if problem else None,
+                alternative=alternative.message if alternative else None,
+                created_at=datetime.now(timezone.utc),
+            )
+            chat.messages.append(pending)
+        else:
+            pending.feedback = feedback
 
-        assert next_state is not None
+        mark_changed()
 
-        if (
-            "blunt" not in chat.objectives_used
-            and len(chat.messages) > 3
-            and len(chat.objectives_used) >= len(generate_suggestions.ALL_OBJECTIVES)
-            and chat.state == "no-objective"
-        ):
-            objective = "blunt-initial"
-            next_state = "objective-blunt"
+    async def explain(reply: str) -> Feedback:
+        if not problem:
+            chat.state = chat_generation.state_after_objective(chat)
+
+        return await generate_feedback.explain_message(
+            pers,
+            chat.agent,
+            objective,
+            problem,
+            message,
+            context(),
+            reply,
+            last3,
+            last_suggestions,
+            on_partial=show_feedback,
+        )
 
-        response_content = await chat_generation.generate_agent_message(
-            pers=pers,
-            chat=chat,
-            state=next_state,
-            objective=objective,
-            problem=problem,
-            bypass_objective_prompt_check=(objective == "blunt-initial"),
+    # The alternative feedback is generated after the turn, see
+    # alternative_feedback.
+    def publish_feedback(feedback: Feedback):
+        chat.events.append(
+            ChatEvent(
+                name="feedback-generated",
+                data=feedback,
+                created_at=datetime.now(timezone.utc),
+            )
         )
+        chat.loading_feedback = False
+        show_feedback(feedback)
+
+    turn.add("feedback", explain, inputs=("reply",), on_result=publish_feedback)
 
-        await asyncio.sleep(3)
+    if not problem:
+        return
 
-        response = ChatMessage(
-            sender=chat.agent,
-            content=response_content,
-            created_at=datetime.now(timezone.utc),
+    async def generate_follow_up(reply: str) -> list[Suggestion]:
+        follow_up = await message_generation.generate_message(
+            scenario=chat.scenario,
+            pers=pers,
+            user_sent=True,
+            agent_name=chat.agent,
+            messages=chat.messages,
+            objective_prompt=generate_suggestions.objective_misunderstand_follow_up_prompt(
+                objective, problem
+            ),
         )
 
-        chat.messages.append(response)
-        chat.last_updated = datetime.now(timezone.utc)
-        chat.agent_typing = False
-        chat.unread = True
+        return [Suggestion(message=follow_up, objective=objective, problem=problem)]
 
-        chat.state = next_state
-        chat.loading_feedback = chat.state == "react"
+    def publish_follow_up(suggestions: list[Suggestion]):
+        random.shuffle(suggestions)
+        chat.suggestions = suggestions
         chat.events.append(
             ChatEvent(
-                name="agent-message",
-                data={"content": response_content, "objective": objective},
+                name="suggested-messages",
+                data={"suggestions": suggestion_list_adapter.dump_python(suggestions)},
                 created_at=datetime.now(timezone.utc),
             )
         )
+        chat.state = "react"
         mark_changed()
 
-        if chat.state == "react":
-            assert isinstance(chat.messages[-2], ChatMessage)
-            assert isinstance(chat.messages[-1], ChatMessage)
-            assert chat.last_suggestions is not None
-            assert objective is not None
+    turn.add(
+        "follow-up", generate_follow_up, inputs=("reply",), on_result=publish_follow_up
+    )
+
 
-            context = message_generation.format_messages_context_short(
-                chat.messages, chat.agent
+async def _generate_agent_message(
+    chat_state: ChatState,
+    user: UserData,
+    objective: str | None = None,
+    problem: str | None = None,
+    speculative: speculation.SpeculativeReply | None = None,
+):
+    async with chat_state.transaction() as (chat, mark_changed):
+        assert user.personalization
+        pers = message_generation.get_personalization_options(
+            user.personalization,
+            chat.options.suggestion_generation == "content-inspired",
+        )
+        chat.agent_typing = True
+        mark_changed()
+
+        next_state, objective = chat_generation.next_state(chat, objective)
+
+        async def generate_reply() -> str:
+            content = await speculation.claim(
+                speculative, chat, next_state, objective, problem
             )
 
-            if not problem:
-                chat.state = (
-                    "no-objective"
-                    if chat.options.gap
-                    or (
-                        len(chat.objectives_used)
-                        >= len(generate_suggestions.ALL_OBJECTIVES)
-                        and "blunt" in chat.options.enabled_objectives
-                    )
-                    else "objective"
+            # A speculative reply is sent right away, without the typing delay.
+            if content is None:
+                content = await chat_generation.generate_agent_message(
+                    pers=pers,
+                    chat=chat,
+                    state=next_state,
+                    objective=objective,
+                    problem=problem,
+                    bypass_objective_prompt_check=(objective == "blunt-initial"),
                 )
+                await asyncio.sleep(3)
 
-                feedback = await generate_feedback.explain_message(
-                    pers,
-                    chat.agent,
-                    objective,
-                    problem,
-                    chat.messages[-2].content,
-                    context,
-                    chat.messages[-1].content,
-                    chat.messages[-3].content
-                    if len(chat.messages) > 2
-                    and isinstance(chat.messages[-3], ChatMessage)
-                    else None,
-                    chat.last_suggestions,
-                )
+            return content
 
-                chat.messages.append(
-                    InChatFeedback(
-                        feedback=feedback,
-                        created_at=datetime.now(timezone.utc),
-                    )
-                )
-                chat.events.append(
-                    ChatEvent(
-                        name="feedback-generated",
-                        data=feedback,
-                        created_at=datetime.now(timezone.utc),
-                    )
+        def publish_reply(content: str):
+            chat.messages.append(
+                ChatMessage(
+                    sender=chat.agent,
+                    content=content,
+                    created_at=datetime.now(timezone.utc),
                 )
-                chat.loading_feedback = False
-
-                mark_changed()
-            else:
-                alternative = next(
-                    filter(lambda s: s.problem is None, chat.last_suggestions)
+            )
+            chat.last_updated = datetime.now(timezone.utc)
+            chat.agent_typing = False
+            chat.unread = True
+
+            chat.state = next_state
+            chat.loading_feedback = chat.state == "react"
+            chat.events.append(
+                ChatEvent(
+                    name="agent-message",
+                    data={"content": content, "objective": objective},
+                    created_at=datetime.now(timezone.utc),
                 )
+            )
+            mark_changed()
 
-                async def generate_feedback_suggestions():
-                    follow_up = await message_generation.generate_message(
-                        scenario=chat.scenario,
-                        pers=pers,
-                        user_sent=True,
-                        agent_name=chat.agent,
-                        messages=chat.messages,
-                        objective_prompt=generate_suggestions.objective_misunderstand_follow_up_prompt(
-                            objective, problem
-                        ),
-                    )
-
-                    return [
-                        Suggestion(
-                            message=follow_up,
-                            objective=objective,
-                            problem=problem,
-                        )
-                    ]
-
-                (
-                    feedback_original,
-                    suggestions,
-                ) = await asyncio.gather(
-                    generate_feedback.explain_message(
-                        pers,
-                        chat.agent,
-                        objective,
-                        problem,
-                        chat.messages[-2].content,
-                        context,
-                        chat.messages[-1].content,
-                        chat.messages[-3].content
-                        if len(chat.messages) > 2
-                        and isinstance(chat.messages[-3], ChatMessage)
-                        else None,
-                        chat.last_suggestions,
-                    ),
-                    generate_feedback_suggestions(),
-                )
+        turn = pipeline.Pipeline("agent-turn")
+        turn.add("reply", generate_reply, on_result=publish_reply)
 
-                feedback_alternative = (
-                    await generate_feedback.explain_message_alternative(
-                        pers,
-                        chat.agent,
-                        objective,
-                        alternative.message,
-                        context,
-                        original=chat.messages[-2].content,
-                        feedback_original=feedback_original.body,
-                    )
-                )
+        if next_state == "react":
+            _add_react_steps(turn, chat, mark_changed, pers, objective, problem)
 
-                chat.messages.append(
-                    InChatFeedback(
-                        feedback=feedback_original,
-                        alternative=alternative.message,
-                        alternative_feedback=feedback_alternative,
-                        created_at=datetime.now(timezone.utc),
-                    )
-                )
-                random.shuffle(suggestions)
-                chat.suggestions = suggestions
-                chat.loading_feedback = False
-                chat.events.append(
-                    ChatEvent(
-                        name="feedback-generated",
-                        data=feedback_original,
-                        created_at=datetime.now(timezone.utc),
-                    )
-                )
-                chat.events.append(
-                    ChatEvent(
-                        name="suggested-messages",
-                        data={
-                            "suggestions": suggestion_list_adapter.dump_python(
-                                suggestions
-                            )
-                        },
-                        created_at=datetime.now(timezone.utc),
-                    )
-                )
-                chat.state = "react"
-                mark_changed()
+        response_content = (await turn.run())["reply"]
 
-                return
+        if next_state == "react" and problem:
+            return
 
     async with chat_state.transaction() as (chat, mark_changed):
         if len(chat.objectives_used) > len(generate_suggestions.ALL_OBJECTIVES):
@@ -402,6 +400,25 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
         mark_changed()
 
         objective = None
+        eager_feedback = (
+            chat.options.feedback_mode == "on-suggestion"
+            and chat.options.suggestion_feedback == "eager"
+        )
+
+        published: list[Suggestion] = []
+
+        def on_progress(suggestions: list[Suggestion]):
+            if not published:
+                published.extend(suggestions)
+                random.shuffle(published)
+                chat.suggestions = published
+
+            chat.generating_suggestions = (
+                sum(1 for suggestion in published if suggestion.feedback is None)
+                if eager_feedback
+                else 0
+            )
+            mark_changed()
 
         if chat.options.suggestion_generation == "random":
             base_message = await message_generation.generate_message(
@@ -415,6 +432,13 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
             base_message = prompt_message
 
         if chat.state == "objective":
+            context = message_generation.format_messages_context_m(
+                chat.messages, chat.agent
+            )
+            classification, variations = await drafts.take(
+                chat.id, context, chat.objectives_used, base_message
+            )
+
             (
                 objective,
                 suggestions,
@@ -422,9 +446,14 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
                 pers,
                 chat.agent,
                 chat.objectives_used,
-                message_generation.format_messages_context_m(chat.messages, chat.agent),
+                context,
                 base_message,
-                chat.options.feedback_mode == "on-suggestion",
+                eager_feedback,
+                classification,
+                variations,
+                chat.options.variation_strategy,
+                on_progress,
+                user.cohort,
             )
 
             chat.objectives_used.append(objective)
@@ -438,7 +467,8 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
                 chat.objectives_used,
                 message_generation.format_messages_context_m(chat.messages, chat.agent),
                 base_message,
-                chat.options.feedback_mode == "on-suggestion",
+                eager_feedback,
+                on_progress,
             )
 
             chat.objectives_used.append("blunt")
@@ -448,7 +478,8 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
                 chat.agent,
                 message_generation.format_messages_context_m(chat.messages, chat.agent),
                 base_message,
-                chat.options.feedback_mode == "on-suggestion",
+                eager_feedback,
+                on_progress,
             )
 
         # if len(chat.objectives_used) > len(generate_suggestions.ALL_OBJECTIVES):
@@ -459,7 +490,11 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
         #         if objective not in chat.options.enabled_objectives
         #     ]
 
-        random.shuffle(suggestions)
+        if not published:
+            published.extend(suggestions)
+            random.shuffle(published)
+
+        suggestions = published
         chat.suggestions = suggestions
         chat.generating_suggestions = 0
         chat.events.append(
@@ -473,6 +508,9 @@ async def _suggest_messages(chat_state: ChatState, user: UserData, prompt_messag
             )
         )
 
+    drafts.discard(chat_state.id)
+    speculation.start(chat_state.read(), user)
+
     return suggestions
 
 
@@ -516,12 +554,80 @@ async def _send_message(chat_state: ChatState, user: UserData, index: int):
 
 
 async def send_message(chat_state: ChatState, user: UserData, index: int):
+    speculative = speculation.take(chat_state.id, index)
     objective, problem = await _send_message(chat_state, user, index)
-    await _generate_agent_message(chat_state, user, objective, problem)
+    await _generate_agent_message(chat_state, user, objective, problem, speculative)
     await chat_state.commit()
 
+    chat = chat_state.read()
+    if chat.messages and isinstance(chat.messages[-1], InChatFeedback):
+        await alternative_feedback(chat_state, user, len(chat.messages) - 1)
+
+
+async def alternative_feedback(chat_state: ChatState, user: UserData, index: int):
+    chat = chat_state.read()
+
+    if not 0 <= index < len(chat.messages):
+        return
+
+    feedback = chat.messages[index]
+    if (
+        not isinstance(feedback, InChatFeedback)
+        or feedback.alternative is None
+        or feedback.objective is None
+        or feedback.alternative_feedback is not None
+    ):
+        return
+
+    request = chat_state.alternative_feedback_requests.get(index)
+    if request is None:
+        original = chat.messages[index - 2]
+        assert isinstance(original, ChatMessage)
+        assert user.personalization
+        pers = message_generation.get_personalization_options(
+            user.personalization,
+            chat.options.suggestion_generation == "content-inspired",
+        )
 
-async def mark_view_suggestion(chat_state: ChatState, index: int):
+        request = asyncio.create_task(
+            generate_feedback.explain_message_alternative(
+                pers,
+                chat.agent,
+                feedback.objective,
+                feedback.alternative,
+                message_generation.format_messages_context_short(
+                    chat.messages[:index], chat.agent
+                ),
+                original=original.content,
+                feedback_original=feedback.feedback.body,
+            )
+        )
+        chat_state.alternative_feedback_requests[index] = request
+
+    try:
+        feedback_alternative = await asyncio.shield(request)
+
+        async with chat_state.transaction() as (chat, mark_changed):
+            if feedback.alternative_feedback is not None:
+                return
+
+            feedback.alternative_feedback = feedback_alternative
+            chat.events.append(
+                ChatEvent(
+                    name="alternative-feedback-generated",
+                    data={"index": index, "feedback": feedback_alternative},
+                    created_at=datetime.now(timezone.utc),
+                )
+            )
+            mark_changed()
+    finally:
+        if chat_state.alternative_feedback_requests.get(index) is request:
+            del chat_state.alternative_feedback_requests[index]
+
+    await chat_state.commit()
+
+
+async def mark_view_suggestion(chat_state: ChatState, user: UserData, index: int):
     async with chat_state.transaction() as (chat, _):
         assert chat.suggestions is not None
 
@@ -535,6 +641,69 @@ async def mark_view_suggestion(chat_state: ChatState, index: int):
             )
         )
 
+    await suggestion_feedback(chat_state, user, index)
+
+
+async def suggestion_feedback(chat_state: ChatState, user: UserData, index: int):
+    chat = chat_state.read()
+
+    # Suggestions still being generated get their feedback from that request.
+    if (
+        chat.options.feedback_mode != "on-suggestion"
+        or chat.generating_suggestions > 0
+        or chat.suggestions is None
+        or not 0 <= index < len(chat.suggestions)
+        or chat.suggestions[index].feedback is not None
+    ):
+        return
+
+    suggestions = chat.suggestions
+    suggestion = suggestions[index]
+
+    request = chat_state.feedback_requests.get(index)
+    if request is None or request[0] is not suggestions:
+        assert user.personalization
+        pers = message_generation.get_personalization_options(
+            user.personalization,
+            chat.options.suggestion_generation == "content-inspired",
+        )
+
+        task = asyncio.create_task(
+            generate_feedback.explain_suggestion(
+                pers,
+                chat.agent,
+                suggestion.objective or "generic",
+                suggestion.problem,
+                message_generation.format_messages_context_m(chat.messages, chat.agent),
+                suggestion.message,
+            )
+        )
+        request = (suggestions, task)
+        chat_state.feedback_requests[index] = request
+
+    try:
+        feedback = await asyncio.shield(request[1])
+
+        async with chat_state.transaction() as (chat, mark_changed):
+            if chat.suggestions is not suggestions or suggestion.feedback is not None:
+                return
+
+            suggestion.feedback = feedback
+            chat.events.append(
+                ChatEvent(
+                    name="suggestion-feedback-generated",
+                    data={"index": index, "feedback": feedback},
+                    created_at=datetime.now(timezone.utc),
+                )
+            )
+            mark_changed()
+    finally:
+        # Finished requests are dropped so that a failed one is retried.
+        if chat_state.feedback_requests.get(index) is request and request[1].done():
+            del chat_state.feedback_requests[index]
+
+    await chat_state.commit()
+
 
 async def mark_read(chat_state: ChatState):
     async with chat_state.transaction() as (chat, _):
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import logging
+from typing import Any, Literal
+
+import msgpack
+from fastapi import WebSocket, WebSocketDisconnect
+
+logger = logging.getLogger(__name__)
+
+Encoding = Literal["json", "msgpack"]
+
+ENCODINGS: list[Encoding] = ["msgpack", "json"]
+
+
+def negotiate_encoding(requested: Any) -> Encoding:
+    if isinstance(requested, str):
+        requested = [requested]
+
+    if isinstance(requested, list):
+        for encoding in ENCODINGS:
+            if encoding in requested:
+                return encoding
+
+    return "json"
+
+
+class ChatSocket:
+    def __init__(self, ws: WebSocket, encoding: Encoding = "json"):
+        self.ws = ws
+        self.encoding = encoding
+        self.closed = False
+        self._pending: set[asyncio.Task] = set()
+
+    async def send(self, data: dict):
+        if self.encoding == "msgpack":
+            await self.ws.send_bytes(msgpack.packb(data))
+        else:
+            await self.ws.send_json(data)
+
+    # Sends from callbacks that cannot await. Messages for a socket that has
+    # closed meanwhile are dropped.
+    def send_soon(self, data: dict):
+        async def send():
+            if self.closed:
+                return
+
+            try:
+                await self.send(data)
+            except (WebSocketDisconnect, RuntimeError) as e:
+                self.closed = True
+                logger.debug(f"Dropped message for closed socket: {e}")
+
+        task = asyncio.create_task(send())
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def receive(self) -> dict:
+        message = await self.ws.receive()
+
+        if message["type"] == "websocket.disconnect":
+            self.closed = True
+            raise WebSocketDisconnect(message.get("code", 1000))
+
+        if message.get("bytes") is not None:
+            return msgpack.unpackb(message["bytes"])
+
+        return json.loads(message["text"])
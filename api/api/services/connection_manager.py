@@ -1,5 +1,8 @@
 import asyncio
+import logging
+import os
 import secrets
+import time
 from asyncio import Task
 from collections.abc import Coroutine
 from typing import Any, Callable
@@ -7,13 +10,22 @@ from typing import Any, Callable
 from bson import ObjectId
 
 from api.services.chat_service import ChatState
+from api.services.rate_limit import USER_RATE_LIMITS, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+_RESUME_WINDOW = float(os.getenv("WS_RESUME_WINDOW_SECONDS", "120"))
 
 
 class ConnectionManager:
     def __init__(self):
         self._on_change: dict[str, Callable[[ChatState], None]] = {}
+        self._on_message: dict[str, Callable[[dict], None]] = {}
         self._listeners: dict[ObjectId, Task] = {}
         self._actions: dict[ObjectId, tuple[ChatState, dict[str, Task]]] = {}
+        self._closed: dict[str, float] = {}
+        self.rate_limiter = RateLimiter(USER_RATE_LIMITS)
+        self.provisioning = 0
 
     def _add_listener(self, chat_state: ChatState):
         if chat_state.id not in self._listeners:
@@ -34,7 +46,26 @@ class ConnectionManager:
     def add_state(self, chat_state: ChatState):
         self._actions[chat_state.id] = (chat_state, {})
 
-    def add_action(self, chat_state: ChatState, action: Coroutine[Any, Any, Any]):
+    def publish(self, message: dict):
+        for on_message in self._on_message.values():
+            on_message(message)
+
+    def publish_state(self, chat_state: ChatState):
+        self.add_state(chat_state)
+
+        for on_change in self._on_change.values():
+            on_change(chat_state)
+
+    def set_provisioning(self, pending: int):
+        self.provisioning = pending
+        self.publish({"type": "provisioning-chats", "pending": pending})
+
+    def add_action(
+        self,
+        chat_state: ChatState,
+        action: Coroutine[Any, Any, Any],
+        on_done: Callable[[Exception | None], None] | None = None,
+    ):
         action_id = secrets.token_hex(32)
         self._add_listener(chat_state)
         if chat_state.id not in self._actions:
@@ -43,27 +74,60 @@ class ConnectionManager:
         task_action = asyncio.create_task(action)
 
         async def run_action():
-            await task_action
+            error = None
+            try:
+                await task_action
+            except Exception as e:
+                logger.exception("Chat action failed")
+                error = e
+
             del self._actions[chat_state.id][1][action_id]
 
-            if len(self._actions[chat_state.id][1]) == 0:
-                self._listeners[chat_state.id].cancel()
-                del self._listeners[chat_state.id]
+            if (
+                len(self._actions[chat_state.id][1]) == 0
+                and chat_state.id in self._listeners
+            ):
+                self._listeners.pop(chat_state.id).cancel()
+
+            if on_done:
+                on_done(error)
 
         self._actions[chat_state.id][1][action_id] = asyncio.create_task(run_action())
 
-    def add_listener(self, connection_id: str, on_change: Callable[[ChatState], None]):
+    def add_listener(
+        self,
+        connection_id: str,
+        on_change: Callable[[ChatState], None],
+        on_message: Callable[[dict], None],
+    ):
         self._on_change[connection_id] = on_change
+        self._on_message[connection_id] = on_message
 
         for chat_state, _ in self._actions.values():
             self._add_listener(chat_state)
 
     def close(self, connection_id: str):
-        del self._on_change[connection_id]
+        # The connection may have failed before its listener was added.
+        if self._on_change.pop(connection_id, None) is None:
+            return
+
+        del self._on_message[connection_id]
+        self._closed[connection_id] = time.monotonic()
 
         if len(self._on_change) == 0:
             for listener in self._listeners.values():
                 listener.cancel()
+            self._listeners.clear()
+
+    def resume(self, connection_id: str) -> bool:
+        now = time.monotonic()
+        self._closed = {
+            closed_id: closed_at
+            for closed_id, closed_at in self._closed.items()
+            if now - closed_at < _RESUME_WINDOW
+        }
+
+        return self._closed.pop(connection_id, None) is not None
 
 
 class Connections:
@@ -74,3 +138,6 @@ class Connections:
             self.connections[user_id] = ConnectionManager()
 
         return self.connections[user_id]
+
+
+connections = Connections()
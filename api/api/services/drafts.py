@@ -0,0 +1,161 @@
+import asyncio
+import difflib
+import logging
+import os
+
+from bson import ObjectId
+
+from api.schemas.chat import ChatData
+from api.schemas.user import UserData
+from api.services import generate_suggestions, message_generation, rate_limit
+from api.services.generate_suggestions import MessageVariation
+
+logger = logging.getLogger(__name__)
+
+_MATCH_RATIO = float(os.getenv("DRAFT_MATCH_RATIO", "0.9"))
+_MAX_BACKLOG = int(os.getenv("DRAFT_MAX_BACKLOG", "8"))
+
+
+class DraftSpeculation:
+    def __init__(
+        self,
+        message: str,
+        context: str,
+        objectives_used: list[str],
+        classification: asyncio.Task[str],
+        variations: asyncio.Task[list[MessageVariation]] | None,
+    ):
+        self.message = message
+        self.context = context
+        self.objectives_used = objectives_used
+        self.classification = classification
+        self.variations = variations
+
+    def cancel(self):
+        self.classification.cancel()
+        if self.variations is not None:
+            self.variations.cancel()
+
+
+class DraftMetrics:
+    def __init__(self):
+        self.exact = 0
+        self.close = 0
+        self.misses = 0
+
+
+metrics = DraftMetrics()
+
+_pending: dict[ObjectId, DraftSpeculation] = {}
+
+
+def _normalize(message: str) -> str:
+    return " ".join(message.split())
+
+
+def _consume_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Draft speculation failed: {task.exception()}")
+
+
+def discard(chat_id: ObjectId):
+    if speculation := _pending.pop(chat_id, None):
+        speculation.cancel()
+
+
+def start(chat: ChatData, user: UserData, message: str, variations: bool):
+    message = _normalize(message)
+    current = _pending.get(chat.id)
+
+    if current and current.message == message:
+        if not variations or current.variations is not None:
+            return
+    else:
+        discard(chat.id)
+        current = None
+
+    if (
+        not message
+        or chat.state != "objective"
+        or chat.options.suggestion_generation != "content-inspired"
+        or rate_limit.admission.backlog() > _MAX_BACKLOG
+    ):
+        return
+
+    assert user.personalization
+    pers = message_generation.get_personalization_options(user.personalization, True)
+
+    if current is None:
+        context = message_generation.format_messages_context_m(
+            chat.messages, chat.agent
+        )
+        objectives_used = list(chat.objectives_used)
+
+        async def classify():
+            async with rate_limit.admission.request(rate_limit.EVENT_COSTS["draft"]):
+                return await generate_suggestions.detect_most_compatible_objective(
+                    pers, chat.agent, context, objectives_used, message
+                )
+
+        classification = asyncio.create_task(classify())
+        classification.add_done_callback(_consume_result)
+        current = _pending[chat.id] = DraftSpeculation(
+            message, context, objectives_used, classification, None
+        )
+
+    if variations:
+        speculation = current
+
+        async def generate_variations():
+            objective = await speculation.classification
+            async with rate_limit.admission.request(rate_limit.EVENT_COSTS["draft"]):
+                return await generate_suggestions._generate_message_variations(
+                    pers, chat.agent, objective, speculation.context, message
+                )
+
+        current.variations = asyncio.create_task(generate_variations())
+        current.variations.add_done_callback(_consume_result)
+
+
+async def _result(task: asyncio.Task | None):
+    if task is None:
+        return None
+
+    try:
+        return await task
+    except Exception:
+        return None
+
+
+async def take(
+    chat_id: ObjectId, context: str, objectives_used: list[str], message: str
+) -> tuple[str | None, list[MessageVariation] | None]:
+    speculation = _pending.pop(chat_id, None)
+
+    if speculation is None:
+        return None, None
+
+    message = _normalize(message)
+
+    if (
+        speculation.context != context
+        or speculation.objectives_used != objectives_used
+        or difflib.SequenceMatcher(None, speculation.message, message).ratio()
+        < _MATCH_RATIO
+    ):
+        speculation.cancel()
+        metrics.misses += 1
+        return None, None
+
+    # Classification tolerates small edits, variations rephrase the exact text.
+    if speculation.message != message:
+        if speculation.variations is not None:
+            speculation.variations.cancel()
+        metrics.close += 1
+        return await _result(speculation.classification), None
+
+    metrics.exact += 1
+    return (
+        await _result(speculation.classification),
+        await _result(speculation.variations),
+    )
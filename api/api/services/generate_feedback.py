@@ -1,4 +1,9 @@
+import asyncio
+import logging
+from typing import Callable
+
 from pydantic import BaseModel
+from tenacity import stop_after_attempt
 
 from api.schemas.chat import Feedback, Suggestion
 from api.schemas.user import UserPersonalizationOptions
@@ -6,14 +11,15 @@ from api.schemas.user import UserPersonalizationOptions
 from . import llm
 
 
-async def explain_suggestion(
+# problem_hint replaces the sentence naming the problem, so that the same
+# instructions can be shared by messages with different problems.
+def _suggestion_action(
     pers: UserPersonalizationOptions,
     agent: str,
     objective: str,
     problem: str | None,
-    context: str,
-    message: str,
-) -> Feedback:
+    problem_hint: str | None = None,
+) -> str:
     objective_prompts = {
         ("yes-no-question", True): """
 {user} asked a yes-or-no question that could be interpreted as either a yes or no
@@ -85,7 +91,7 @@ interpret {user}'s emotional tone and intent from their message.
         (
             """
 Now, explain to {user} why their original message could be misinterpreted by {agent}.
-The problem might possibly be that {problem}. Base your feedback on {agent}'s likely
+{problem_hint} Base your feedback on {agent}'s likely
 thought process, their understanding of the tone and intent of {user}'s message, and
 their likely response.
 
@@ -146,21 +152,31 @@ At the end is a model output based on the following sample original message:
         )
     )
 
-    action = action.format(
-        user=pers.name, agent=agent, problem=problem, objective_prompt=objective_prompt
+    return action.format(
+        user=pers.name,
+        agent=agent,
+        problem_hint=problem_hint or f"The problem might possibly be that {problem}.",
+        objective_prompt=objective_prompt,
     )
 
+
+async def explain_suggestion(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    objective: str,
+    problem: str | None,
+    context: str,
+    message: str,
+) -> Feedback:
+    action = _suggestion_action(pers, agent, objective, problem)
+
     system_prompt_template = """
 As a helpful communication guide, you are guiding {user} on their conversation with {agent}.
 
 Respond with a JSON object with keys "title" and "feedback" containing your feedback.
 """
 
-    system = system_prompt_template.format(
-        objective_prompt=objective_prompt,
-        user=pers.name,
-        agent=agent,
-    )
+    system = system_prompt_template.format(user=pers.name, agent=agent)
 
     prompt_template = """
 Here is the conversation history between {user} and {agent}:
@@ -179,6 +195,7 @@ Here is the original message last sent by {user}:
     out = await llm.generate(
         schema=FeedbackOutput,
         model=llm.Model.GPT_4o,
+        call_site="explain_suggestion",
         system=system,
         prompt=prompt,
     )
@@ -191,6 +208,127 @@ class FeedbackOutput(BaseModel):
     feedback: str
 
 
+class FeedbackListOutput(BaseModel):
+    feedback: list[FeedbackOutput]
+
+
+async def explain_suggestions(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    objective: str,
+    context: str,
+    variations: list[tuple[str | None, str]],
+    on_feedback: Callable[[int, Feedback], None] | None = None,
+) -> list[Feedback]:
+    try:
+        explanations = await _explain_suggestions_batched(
+            pers, agent, objective, context, variations
+        )
+    except Exception as e:
+        logging.warning(f"Batched suggestion feedback failed, explaining each: {e}")
+    else:
+        if on_feedback:
+            for index, explanation in enumerate(explanations):
+                on_feedback(index, explanation)
+        return explanations
+
+    async def explain(index: int, problem: str | None, message: str) -> Feedback:
+        explanation = await explain_suggestion(
+            pers, agent, objective, problem, context, message
+        )
+        if on_feedback:
+            on_feedback(index, explanation)
+        return explanation
+
+    return await asyncio.gather(
+        *[
+            explain(index, problem, message)
+            for index, (problem, message) in enumerate(variations)
+        ]
+    )
+
+
+async def _explain_suggestions_batched(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    objective: str,
+    context: str,
+    variations: list[tuple[str | None, str]],
+) -> list[Feedback]:
+    # The instructions only depend on whether a message has a problem, so they
+    # are given once for each and the problems are listed with the messages.
+    actions: dict[str, list[int]] = {}
+    for i, (problem, _) in enumerate(variations):
+        action = _suggestion_action(
+            pers,
+            agent,
+            objective,
+            problem,
+            "The problem might possibly be the one given with the message.",
+        )
+        actions.setdefault(action, []).append(i + 1)
+
+    messages = "\n\n".join(
+        f"Message {i + 1}:\n{message}"
+        + (f"\nPossible problem: {problem}" if problem is not None else "")
+        for i, (problem, message) in enumerate(variations)
+    )
+    instructions = "\n\n".join(
+        f"Instructions for message {', '.join(map(str, numbers))}:\n{action}"
+        for action, numbers in actions.items()
+    )
+
+    system_prompt_template = """
+As a helpful communication guide, you are guiding {user} on their conversation with {agent}.
+
+You will be given several messages {user} could send next. Give separate feedback for
+each of them, treating each one as the original message last sent by {user}.
+
+Respond with a JSON object with a "feedback" key containing a list with one object per
+message, in the order the messages are given. Each object has keys "title" and
+"feedback" containing your feedback for that message.
+"""
+
+    system = system_prompt_template.format(user=pers.name, agent=agent)
+
+    prompt_template = """
+Here is the conversation history between {user} and {agent}:
+{context}
+
+Here are the {count} messages {user} could send next:
+
+{messages}
+
+{instructions}
+
+Respond with exactly {count} feedback objects, one per message, in order.
+"""
+
+    prompt = prompt_template.format(
+        user=pers.name,
+        agent=agent,
+        context=context,
+        count=len(variations),
+        messages=messages,
+        instructions=instructions,
+    )
+
+    out = await llm.generate.retry_with(stop=stop_after_attempt(1))(
+        schema=FeedbackListOutput,
+        model=llm.Model.GPT_4o,
+        max_tokens=llm.OUTPUT_LIMITS["explain_suggestion"].max_tokens * len(variations),
+        system=system,
+        prompt=prompt,
+    )
+
+    if len(out.feedback) != len(variations):
+        raise ValueError(
+            f"Expected {len(variations)} feedback items, got {len(out.feedback)}"
+        )
+
+    return [Feedback(title=item.title, body=item.feedback) for item in out.feedback]
+
+
 class PositiveFeedbackOutput(BaseModel):
     title: str
     praise: str
@@ -208,6 +346,7 @@ async def explain_message(
     reaction: str,
     last3: str | None,
     suggestions: list[Suggestion] | None,
+    on_partial: Callable[[Feedback], None] | None = None,
 ) -> Feedback:
     if not last3:
         last3 = "** Not given **"
@@ -498,21 +637,37 @@ Reinforce the main points of the feedback to ensure {user} understands it.
         example=example,
     )
 
+    body_keys = (
+        ["feedback"] if problem is not None else ["praise", "problems", "conclusion"]
+    )
+
+    # The title is only shown once it is complete, the body as it streams.
+    def publish_partial(values: dict[str, str], complete: set[str]):
+        if on_partial is not None and "title" in complete:
+            body = "\n\n".join(
+                values[key].strip() for key in body_keys if key in values
+            )
+            on_partial(Feedback(title=values["title"], body=body))
+
     if problem is not None:
-        out = await llm.generate(
+        out = await llm.generate_streamed(
             schema=FeedbackOutput,
             model=llm.Model.GPT_4o,
+            call_site="explain_message",
             system=system,
             prompt=prompt,
+            on_partial=publish_partial,
         )
 
         return Feedback(title=out.title, body=out.feedback)
     else:
-        out = await llm.generate(
+        out = await llm.generate_streamed(
             schema=PositiveFeedbackOutput,
             model=llm.Model.GPT_4o,
+            call_site="explain_message",
             system=system,
             prompt=prompt,
+            on_partial=publish_partial,
         )
 
         return Feedback(
@@ -609,6 +764,7 @@ At the end is a model output based on the following sample alternative message:
     res = await llm.generate(
         schema=FeedbackContentOnly,
         model=llm.Model.GPT_4o,
+        call_site="explain_message_alternative",
         system=system,
         prompt=prompt,
     )
@@ -1,14 +1,20 @@
 import asyncio
-from typing import Annotated
+import logging
+from collections import defaultdict
+from typing import Annotated, Callable
 
+from bson import ObjectId
 from pydantic import BaseModel, Field
+from tenacity import stop_after_attempt
 
-from api.schemas.chat import Suggestion
+from api.schemas.chat import Feedback, Suggestion, VariationStrategy
 from api.schemas.user import UserPersonalizationOptions
-from api.services.generate_feedback import explain_suggestion
+from api.services.generate_feedback import explain_suggestions
 
 from . import llm
 
+SuggestionProgress = Callable[[list[Suggestion]], None]
+
 ALL_OBJECTIVES = [
     "non-literal-emoji",
     "non-literal-figurative",
@@ -20,13 +26,7 @@ class ObjectiveOut(BaseModel):
     classification: str
 
 
-async def detect_most_compatible_objective(
-    pers: UserPersonalizationOptions,
-    agent: str,
-    conversation_history: str,
-    objectives_used: list[str],
-    message: str,
-) -> str:
+def _describe_objectives(objectives: list[str]) -> str:
     objective_descriptions = {
         "yes-no-question": "This objective fits when it is possible to rephrase the message as a yes or no question, such that the response to the rephrased message is not entirely helpful/as expected. For example, the message 'What time is it?' can be rephrased to 'Do you know what time is it?'. This new message may be answered with a 'Yes' or 'No'. However, the correct response should contain details about the time too if the person knows it.",
         "non-literal-emoji": (
@@ -37,21 +37,37 @@ async def detect_most_compatible_objective(
         ),
     }
 
+    return "\n".join(
+        [
+            f"- '{objective}': {objective_descriptions[objective]}"
+            for objective in objectives
+        ]
+    )
+
+
+def _objectives_to_consider(objectives_used: list[str]) -> list[str]:
     objectives_to_consider = [
         objective for objective in ALL_OBJECTIVES if objective not in objectives_used
     ]
 
     assert objectives_to_consider, "All objectives have been used"
 
+    return objectives_to_consider
+
+
+async def detect_most_compatible_objective(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    conversation_history: str,
+    objectives_used: list[str],
+    message: str,
+) -> str:
+    objectives_to_consider = _objectives_to_consider(objectives_used)
+
     if len(objectives_to_consider) == 1:
         return objectives_to_consider[0]
 
-    objectives_consider_str = "\n".join(
-        [
-            f"- '{objective}': {objective_descriptions[objective]}"
-            for objective in objectives_to_consider
-        ]
-    )
+    objectives_consider_str = _describe_objectives(objectives_to_consider)
 
     system = """
     Your task is to determine the most fitting category
@@ -79,6 +95,7 @@ async def detect_most_compatible_objective(
     out = await llm.generate(
         schema=ObjectiveOut,
         model=llm.Model.GPT_4o,
+        call_site="detect_most_compatible_objective",
         system=system.format(objectives_consider_str=objectives_consider_str),
         prompt=prompt,
     )
@@ -106,56 +123,96 @@ async def generate_message_variations(
     context: str,
     message: str,
     feedback: bool,
+    classification: str | None = None,
+    variations: list[MessageVariation] | None = None,
+    strategy: VariationStrategy = "sequential",
+    on_progress: SuggestionProgress | None = None,
+    cohort: ObjectId | None = None,
 ) -> tuple[str, list[Suggestion]]:
-    messages = []
-    classification = await detect_most_compatible_objective(
-        pers, agent, context, objectives_used, message
-    )
+    if strategy == "fused" and classification is None and variations is None:
+        objectives_to_consider = _objectives_to_consider(objectives_used)
 
-    messages = await _generate_message_variations(
-        pers, agent, classification, context, message
-    )
-
-    if feedback:
-        explanations = await asyncio.gather(
-            *[
-                explain_suggestion(
-                    pers,
-                    agent,
+        if len(objectives_to_consider) > 1:
+            try:
+                (
                     classification,
-                    variation.problem,
-                    context,
-                    variation.content,
+                    variations,
+                ) = await _classify_and_generate_variations(
+                    pers, agent, objectives_to_consider, context, message
                 )
-                for variation in messages
-            ]
+            except Exception as e:
+                logging.warning(f"Fused variation generation failed: {e}")
+
+    if (
+        strategy == "race"
+        and classification is None
+        and variations is None
+        and len(_objectives_to_consider(objectives_used)) > 1
+    ):
+        classification, variations = await _race_variations(
+            pers, agent, objectives_used, context, message, cohort
         )
 
-        suggestions = [
-            Suggestion(
-                message=variation.content,
-                problem=variation.problem,
-                objective=classification,
-                feedback=explanation,
-            )
-            for variation, explanation in zip(messages, explanations)
-        ]
-    else:
-        suggestions = [
-            Suggestion(
-                message=variation.content,
-                problem=variation.problem,
-                objective=classification,
-            )
-            for variation in messages
-        ]
+    if classification is None:
+        classification = await detect_most_compatible_objective(
+            pers, agent, context, objectives_used, message
+        )
+
+    messages = (
+        variations
+        if variations is not None
+        else await _generate_message_variations(
+            pers, agent, classification, context, message
+        )
+    )
+
+    suggestions = [
+        Suggestion(
+            message=variation.content,
+            problem=variation.problem,
+            objective=classification,
+        )
+        for variation in messages
+    ]
+
+    await _publish_and_explain(
+        pers, agent, classification, context, suggestions, feedback, on_progress
+    )
 
     return classification, suggestions
 
 
-async def _generate_message_variations(
-    pers: UserPersonalizationOptions, agent, objective: str, context: str, message: str
-) -> list[MessageVariation]:
+async def _publish_and_explain(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    objective: str,
+    context: str,
+    suggestions: list[Suggestion],
+    feedback: bool,
+    on_progress: SuggestionProgress | None,
+):
+    if on_progress:
+        on_progress(suggestions)
+
+    if not feedback:
+        return
+
+    def on_feedback(index: int, explanation: Feedback):
+        suggestions[index].feedback = explanation
+        if on_progress:
+            on_progress(suggestions)
+
+    await explain_suggestions(
+        pers,
+        agent,
+        objective,
+        context,
+        [(suggestion.problem, suggestion.message) for suggestion in suggestions],
+        on_feedback,
+    )
+
+
+def _variation_prompts(objective: str) -> tuple[str, str]:
     objective_prompts = {
         "yes-no-question": (
             """
@@ -248,8 +305,6 @@ like "What", "How", "Where", "When", "Why", "Which", or "Who" to ask the questio
         ),
     }
 
-    objective_prompt = objective_prompts[objective]
-
     objective_example_prompts = {
         "yes-no-question": """
 Example 1.
@@ -368,7 +423,13 @@ Message to generate variations for: Ok, I will get the report done.
 """,
     }
 
-    objective_example_prompt = objective_example_prompts[objective]
+    return objective_prompts[objective], objective_example_prompts[objective]
+
+
+async def _generate_message_variations(
+    pers: UserPersonalizationOptions, agent, objective: str, context: str, message: str
+) -> list[MessageVariation]:
+    objective_prompt, objective_example_prompt = _variation_prompts(objective)
 
     system_prompt = """
 Respond with a JSON object containing the key "variations" and a list of the three
@@ -400,6 +461,7 @@ You are generating VARIATIONS of {pers.name}'s message, not responding to it. Do
     out = await llm.generate(
         schema=MessageVariationOut,
         model=llm.Model.GPT_4o,
+        call_site="_generate_message_variations",
         system=system_prompt,
         prompt=prompt,
         temperature=0.5,
@@ -411,40 +473,163 @@ You are generating VARIATIONS of {pers.name}'s message, not responding to it. Do
     return out.variations
 
 
+class RaceCosts:
+    def __init__(self):
+        self.races = 0
+        self.calls = 0
+        self.wasted = 0
+
+
+# Keyed by cohort, as the strategy is chosen per cohort's chat options.
+race_costs: defaultdict[ObjectId | None, RaceCosts] = defaultdict(RaceCosts)
+
+
+async def _race_variations(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    objectives_used: list[str],
+    context: str,
+    message: str,
+    cohort: ObjectId | None,
+) -> tuple[str | None, list[MessageVariation] | None]:
+    branches = {
+        objective: asyncio.create_task(
+            _generate_message_variations(pers, agent, objective, context, message)
+        )
+        for objective in _objectives_to_consider(objectives_used)
+    }
+    costs = race_costs[cohort]
+
+    try:
+        classification = await detect_most_compatible_objective(
+            pers, agent, context, objectives_used, message
+        )
+    except BaseException as e:
+        for branch in branches.values():
+            branch.cancel()
+        if not isinstance(e, Exception):
+            raise
+
+        logging.warning(f"Variation race classification failed: {e}")
+        return None, None
+    finally:
+        costs.races += 1
+        costs.calls += len(branches) + 1
+
+    # Cancelled requests are still billed by the gateway, so every losing
+    # branch counts as wasted.
+    for objective, branch in branches.items():
+        if objective != classification:
+            branch.cancel()
+            costs.wasted += 1
+
+    logging.info(
+        f"Variation race for cohort {cohort} wasted {costs.wasted} of "
+        f"{costs.calls} calls over {costs.races} races"
+    )
+
+    if classification not in branches:
+        return classification, None
+
+    # Without variations the caller generates them sequentially.
+    try:
+        return classification, await branches[classification]
+    except Exception as e:
+        logging.warning(f"Variation race branch failed: {e}")
+        return classification, None
+
+
+class ObjectiveVariationOut(BaseModel):
+    classification: str
+    variations: Annotated[list[MessageVariation], Field(min_length=3, max_length=3)]
+
+
+async def _classify_and_generate_variations(
+    pers: UserPersonalizationOptions,
+    agent: str,
+    objectives_to_consider: list[str],
+    context: str,
+    message: str,
+) -> tuple[str, list[MessageVariation]]:
+    instructions = []
+    for objective in objectives_to_consider:
+        objective_prompt, objective_example_prompt = _variation_prompts(objective)
+        instructions.append(
+            f"If you choose '{objective}', generate the variations as follows:\n"
+            f"{objective_prompt}\nHere is an example to guide you:\n"
+            f"{objective_example_prompt}"
+        )
+    instructions_str = "\n\n".join(instructions)
+
+    system_prompt = """
+Respond with a JSON object containing the key "classification" with the chosen category
+and the key "variations" with a list of the three objects representing the rephrased
+messages. Each object should have a key "problem" with a description of the problem
+that the rephrased message introduces, and a key "content" with the rephrased message.
+"""
+
+    prompt = f"""
+Here are the latest four messages in the conversation history between {pers.name} and {agent}:
+
+{context}
+
+The next message by {pers.name} is:
+
+{message}
+
+First, classify this message into the ONE category that fits best based on how it can be
+REPHRASED, not the original message itself:
+
+{_describe_objectives(objectives_to_consider)}
+
+Then come up with variations of the message for the chosen category.
+
+{instructions_str}
+
+All variations should be the same length.
+It should not be obvious which variation is considered the correct one without understanding the nuance of the objective.
+You are generating VARIATIONS of {pers.name}'s message, not responding to it. Don't get confused here.
+"""
+    out = await llm.generate.retry_with(stop=stop_after_attempt(1))(
+        schema=ObjectiveVariationOut,
+        model=llm.Model.GPT_4o,
+        call_site="_classify_and_generate_variations",
+        system=system_prompt,
+        prompt=prompt,
+        temperature=0.5,
+    )
+
+    if out.classification not in objectives_to_consider:
+        raise ValueError(f"Unexpected classification {out.classification!r}")
+
+    variations = out.variations
+    variations[0].problem = None
+
+    return out.classification, variations
+
+
 async def generate_message_variations_ok(
     pers: UserPersonalizationOptions,
     agent: str,
     context: str,
     message: str,
     feedback: bool,
+    on_progress: SuggestionProgress | None = None,
 ) -> list[Suggestion]:
     messages = await _generate_message_variations_ok(pers, agent, context, message)
-    if feedback:
-        explanations = await asyncio.gather(
-            *[
-                explain_suggestion(pers, agent, "generic", None, context, message)
-                for message in messages
-            ]
+    suggestions = [
+        Suggestion(
+            message=message,
+            problem=None,
+            objective=None,
         )
+        for message in messages
+    ]
+
+    await _publish_and_explain(
+        pers, agent, "generic", context, suggestions, feedback, on_progress
+    )
 
-        suggestions = [
-            Suggestion(
-                message=message,
-                problem=None,
-                objective=None,
-                feedback=explanation,
-            )
-            for message, explanation in zip(messages, explanations)
-        ]
-    else:
-        suggestions = [
-            Suggestion(
-                message=message,
-                problem=None,
-                objective=None,
-            )
-            for message in messages
-        ]
     return suggestions
 
 
@@ -476,6 +661,7 @@ Remember, you are generating 3 VARIATIONS of {pers.name}'s message, not respondi
     out = await llm.generate(
         schema=MessageVariationOutOk,
         model=llm.Model.GPT_4o,
+        call_site="_generate_message_variations_ok",
         system=system_prompt,
         prompt=prompt,
     )
@@ -649,45 +835,29 @@ async def generate_message_variations_blunt(
     context: str,
     message: str,
     feedback: bool,
+    on_progress: SuggestionProgress | None = None,
 ) -> tuple[str, list[Suggestion]]:
-    messages = []
-
     messages = await _generate_message_variations(
         pers, agent, "blunt-misinterpret", context, message
     )
 
-    if feedback:
-        explanations = await asyncio.gather(
-            *[
-                explain_suggestion(
-                    pers,
-                    agent,
-                    "blunt-misinterpret",
-                    variant.problem,
-                    context,
-                    variant.content,
-                )
-                for variant in messages
-            ]
+    suggestions = [
+        Suggestion(
+            message=variant.content,
+            problem=variant.problem,
+            objective="blunt-misinterpret",
         )
+        for variant in messages
+    ]
 
-        suggestions = [
-            Suggestion(
-                message=variant.content,
-                problem=variant.problem,
-                objective="blunt-misinterpret",
-                feedback=explanation,
-            )
-            for variant, explanation in zip(messages, explanations)
-        ]
-    else:
-        suggestions = [
-            Suggestion(
-                message=variant.content,
-                problem=variant.problem,
-                objective="blunt-misinterpret",
-            )
-            for variant in messages
-        ]
+    await _publish_and_explain(
+        pers,
+        agent,
+        "blunt-misinterpret",
+        context,
+        suggestions,
+        feedback,
+        on_progress,
+    )
 
     return "blunt-misinterpret", suggestions
@@ -0,0 +1,193 @@
+import json
+import logging
+import re
+from collections import Counter, defaultdict
+from typing import Any
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+logger = logging.getLogger(__name__)
+
+_CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+# Outcomes per schema name: "parsed" on the first try, "repaired" after a local
+# repair, "truncated" after closing a cut off response, "failed" when the call
+# has to be retried.
+outcomes: defaultdict[str, Counter[str]] = defaultdict(Counter)
+
+
+def schema_name(schema: type[BaseModel] | TypeAdapter) -> str:
+    if isinstance(schema, TypeAdapter):
+        return f"TypeAdapter[{schema.core_schema['type']}]"
+
+    return schema.__name__
+
+
+def record(name: str, outcome: str):
+    outcomes[name][outcome] += 1
+
+    if outcome != "parsed":
+        counts = outcomes[name]
+        logger.info(
+            f"JSON for {name} {outcome}: {counts['parsed']} parsed, "
+            f"{counts['repaired']} repaired, {counts['truncated']} truncated, "
+            f"{counts['failed']} failed"
+        )
+
+
+def _normalize_strings(text: str) -> str:
+    out = []
+    quote = None
+    i = 0
+
+    while i < len(text):
+        char = text[i]
+
+        if quote is None:
+            if char in "\"'":
+                quote = char
+                out.append('"')
+            else:
+                out.append(char)
+        elif char == "\\" and i + 1 < len(text):
+            escaped = text[i + 1]
+            out.append(escaped if escaped == "'" else char + escaped)
+            i += 1
+        elif char == quote:
+            quote = None
+            out.append('"')
+        elif char == '"':
+            out.append('\\"')
+        elif char == "\n":
+            out.append("\\n")
+        elif char == "\t":
+            out.append("\\t")
+        elif ord(char) >= 0x20 and char != "\x7f":
+            out.append(char)
+
+        i += 1
+
+    return "".join(out)
+
+
+# Fixes defects LLMs commonly produce: code fences, text around the object,
+# single-quoted strings, raw newlines inside strings and trailing commas.
+def repair(text: str) -> str:
+    if fenced := _CODE_FENCE.search(text):
+        text = fenced.group(1)
+
+    start = text.find("{")
+    end = text.rfind("}")
+    if start >= 0 and end > start:
+        text = text[start : end + 1]
+
+    text = _normalize_strings(text)
+
+    return _TRAILING_COMMA.sub(r"\1", text)
+
+
+def _scan(text: str) -> tuple[list[str], int | None, list[tuple[int, str]]]:
+    closers: list[str] = []
+    open_string = None
+    # Commas between list items, where the text can be cut without keeping a
+    # partial item, with what closes it at that point.
+    cuts: list[tuple[int, str]] = []
+    i = 0
+
+    while i < len(text):
+        char = text[i]
+
+        if open_string is not None:
+            if char == "\\":
+                i += 1
+            elif char == '"':
+                open_string = None
+        elif char == '"':
+            open_string = i
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]" and closers:
+            closers.pop()
+        elif char == "," and closers and closers[-1] == "]":
+            cuts.append((i, "".join(reversed(closers))))
+
+        i += 1
+
+    return closers, open_string, cuts
+
+
+def is_truncated(text: str) -> bool:
+    start = text.find("{")
+    if start < 0:
+        return False
+
+    closers, open_string, _ = _scan(text[start:])
+    return open_string is not None or bool(closers)
+
+
+# Candidates for a truncated object, dropping the trailing list items that were
+# cut off. A string that was cut off is never closed, as its value is partial.
+def _close(text: str) -> list[str]:
+    closers, open_string, cuts = _scan(text)
+
+    # The text can only be closed as is if it did not stop inside a list item.
+    candidates = []
+    if open_string is None and "]" not in closers[:-1]:
+        candidates.append(text.rstrip() + "".join(reversed(closers)))
+
+    return candidates + [text[:i] + closing for i, closing in reversed(cuts)]
+
+
+def _load(response: str, truncated: bool) -> Any:
+    if not truncated:
+        return json.loads(repair(response))
+
+    text = _normalize_strings(response[max(response.find("{"), 0) :])
+
+    for candidate in _close(text):
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r"\1", candidate))
+        except ValueError:
+            continue
+
+    raise ValueError("Could not close truncated JSON")
+
+
+def _trim_lists(data: Any, error: ValidationError) -> bool:
+    trimmed = False
+
+    for detail in error.errors():
+        if detail["type"] != "too_long":
+            continue
+
+        target = data
+        try:
+            for key in detail["loc"]:
+                target = target[key]
+        except (KeyError, IndexError, TypeError):
+            continue
+
+        if isinstance(target, list):
+            del target[detail["ctx"]["max_length"] :]
+            trimmed = True
+
+    return trimmed
+
+
+# Repairs the response and validates it, trimming lists that are longer than
+# the schema allows. Truncated responses are closed after their last complete
+# list item instead. Raises ValueError if it cannot be salvaged.
+def salvage(
+    schema: type[BaseModel] | TypeAdapter, response: str, truncated: bool = False
+) -> Any:
+    adapter = schema if isinstance(schema, TypeAdapter) else TypeAdapter(schema)
+    data = _load(response, truncated)
+
+    try:
+        return adapter.validate_python(data)
+    except ValidationError as e:
+        if not _trim_lists(data, e):
+            raise
+
+    return adapter.validate_python(data)
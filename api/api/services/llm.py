@@ -3,9 +3,11 @@ import json
 import logging
 import os
 import re
+import time
+from collections.abc import AsyncIterator
 from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import TypeVar, overload
+from typing import Callable, NamedTuple, TypeVar, overload
 
 import numpy as np
 import requests
@@ -13,12 +15,24 @@ import websockets as ws
 from pydantic import BaseModel, TypeAdapter
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
+from . import json_repair
+from .partial_json import parse_partial_object
+
 _LLM_URI: str = os.getenv("LLM_URI", "")
 _LLM_KEY: str = os.getenv("LLM_KEY", "")
 
 assert _LLM_URI != "", "LLM_URI environment variable must be set"
 assert _LLM_KEY != "", "LLM_KEY environment variable must be set"
 
+_STREAMING = os.getenv("LLM_STREAMING", "false").lower() == "true"
+_STREAM_PARTIAL_INTERVAL = float(
+    os.getenv("LLM_STREAM_PARTIAL_INTERVAL_SECONDS", "0.25")
+)
+_STREAM_FRAME_TIMEOUT = 30.0
+
+# Shared so that cancelling a request does not block on shutting down a pool.
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_MAX_WORKERS", "64")))
+
 
 class Model(str, Enum):
     GPT_4 = "gpt4-new"
@@ -31,9 +45,57 @@ class Model(str, Enum):
     CLAUDE_3p5_SONNET = "us.anthropic.claude-3-5-sonnet-20240620-v1:0"
 
 
+class OutputLimits(NamedTuple):
+    max_tokens: int | None = None
+    stop: tuple[str, ...] = ()
+
+
+# Defaults for each caller of generate, passed as call_site. Batched calls scale
+# the limit of a single item. They are generous
+# compared to what the prompts ask for and only stop runaway responses.
+OUTPUT_LIMITS: dict[str, OutputLimits] = {
+    "generate_message": OutputLimits(max_tokens=300),
+    "decide_whether_to_message": OutputLimits(max_tokens=50),
+    "detect_most_compatible_objective": OutputLimits(max_tokens=50),
+    "_generate_message_variations": OutputLimits(max_tokens=800),
+    "_classify_and_generate_variations": OutputLimits(max_tokens=900),
+    "_generate_message_variations_ok": OutputLimits(max_tokens=600),
+    "explain_suggestion": OutputLimits(max_tokens=500),
+    "explain_message": OutputLimits(max_tokens=1000),
+    "explain_message_alternative": OutputLimits(max_tokens=400),
+    "generate_topic_message": OutputLimits(max_tokens=400),
+    "generate_scenario_message": OutputLimits(max_tokens=300),
+}
+
+# Finish reasons the gateway may report when a response hit max_tokens.
+_TRUNCATED_REASONS = {"length", "max_tokens"}
+
+
+class GatewayResponse(NamedTuple):
+    text: str
+    truncated: bool
+
+
+def _limits(
+    call_site: str | None, max_tokens: int | None, stop: list[str] | None
+) -> dict:
+    defaults = (
+        OUTPUT_LIMITS.get(call_site, OutputLimits()) if call_site else OutputLimits()
+    )
+
+    return {
+        "max_tokens": max_tokens or defaults.max_tokens,
+        "stop": stop or list(defaults.stop) or None,
+    }
+
+
 async def _generate_unchecked(
-    model: Model, prompt: str, system: str, temperature: float | None = None
-) -> str:
+    model: Model,
+    prompt: str,
+    system: str,
+    temperature: float | None = None,
+    limits: dict | None = None,
+) -> GatewayResponse:
     body = {
         "model": model.value,
         "system": system,
@@ -41,6 +103,7 @@ async def _generate_unchecked(
         "lastk": 0,
         "temperature": temperature,
         "cache_match_thresh": 1.1,
+        **(limits or {}),
     }
     body = {k: v for k, v in body.items() if v is not None}
 
@@ -52,12 +115,11 @@ async def _generate_unchecked(
         return response.json()
 
     loop = asyncio.get_running_loop()
-    with ThreadPoolExecutor() as pool:
-        try:
-            res = await loop.run_in_executor(pool, make_request)
-        except requests.exceptions.HTTPError as e:
-            print(f"Request failed: {e}")
-            raise e
+    try:
+        res = await loop.run_in_executor(_EXECUTOR, make_request)
+    except requests.exceptions.HTTPError as e:
+        print(f"Request failed: {e}")
+        raise e
 
     print("-----------------")
     print(system)
@@ -66,7 +128,9 @@ async def _generate_unchecked(
     print(res)
     print("-----------------")
 
-    return res["result"]
+    finish_reason = res.get("finish_reason", res.get("stop_reason"))
+
+    return GatewayResponse(res["result"], finish_reason in _TRUNCATED_REASONS)
 
 
 SchemaType = TypeVar("SchemaType", bound=BaseModel)
@@ -79,6 +143,9 @@ async def generate(
     prompt: str,
     system: str,
     temperature: float | None = None,
+    call_site: str | None = None,
+    max_tokens: int | None = None,
+    stop: list[str] | None = None,
 ) -> str: ...
 
 
@@ -89,9 +156,16 @@ async def generate(
     prompt: str,
     system: str,
     temperature: float | None = None,
+    call_site: str | None = None,
+    max_tokens: int | None = None,
+    stop: list[str] | None = None,
 ) -> SchemaType: ...
 
 
+class TruncatedResponse(ValueError):
+    pass
+
+
 @retry(wait=wait_random_exponential(), stop=stop_after_attempt(5))
 async def generate(
     schema: type[SchemaType] | TypeAdapter[SchemaType] | None,
@@ -99,30 +173,193 @@ async def generate(
     prompt: str,
     system: str,
     temperature: float | None = None,
+    call_site: str | None = None,
+    max_tokens: int | None = None,
+    stop: list[str] | None = None,
 ) -> SchemaType | str:
+    limits = _limits(call_site, max_tokens, stop)
     response = None
     try:
-        response = await _generate_unchecked(model, prompt, system, temperature)
-        data = (
-            response[response.index("{") : response.rindex("}") + 1]
-            if schema
-            else response
+        response, truncated = await _generate_unchecked(
+            model, prompt, system, temperature, limits
         )
+        try:
+            return _parse(schema, response, truncated)
+        except TruncatedResponse:
+            if not limits["max_tokens"]:
+                raise
+
+        # A response cut off by the limit is not worth repairing or retrying
+        # with the same limit.
+        limits["max_tokens"] *= 2
+        logging.warning(
+            f"Generate response for {call_site} was truncated, retrying with "
+            f"max_tokens={limits['max_tokens']}"
+        )
+        response, truncated = await _generate_unchecked(
+            model, prompt, system, temperature, limits
+        )
+        return _parse(schema, response, truncated)
+    except Exception as e:
+        logging.warning(f"Generate Unexpected error: {e}. {response}")
+
+        raise RuntimeError("Could not generate valid response") from e
+
+
+def _parse(
+    schema: type[SchemaType] | TypeAdapter[SchemaType] | None,
+    response: str,
+    truncated: bool = False,
+) -> SchemaType | str:
+    if schema is None:
+        if truncated:
+            logging.warning(f"Generate response was truncated: {response}")
 
         # strip control characters from data
-        data = re.sub(r"[\x00-\x1f\x7f]", "", data)
+        return re.sub(r"[\x00-\x1f\x7f]", "", response)
+
+    name = json_repair.schema_name(schema)
 
-        if schema is None:
-            return data
-        if isinstance(schema, TypeAdapter):
-            return schema.validate_json(data)
-        else:
-            return schema.model_validate_json(data)
+    # Slicing a cut off object to its last "}" can validate against the wrong
+    # data, so only the strict parse is skipped when the gateway reports it.
+    if not truncated:
+        try:
+            result = _parse_strict(schema, response)
+            json_repair.record(name, "parsed")
+            return result
+        except ValueError as e:
+            error = e
+
+        truncated = json_repair.is_truncated(response)
+
+    if truncated:
+        try:
+            result = json_repair.salvage(schema, response, truncated=True)
+        except ValueError as e:
+            json_repair.record(name, "failed")
+            raise TruncatedResponse("Response was truncated") from e
+
+        json_repair.record(name, "truncated")
+        return result
+
+    # Repair locally before spending another LLM call on a retry.
+    try:
+        result = json_repair.salvage(schema, response)
+    except ValueError:
+        json_repair.record(name, "failed")
+        raise error from None
+
+    json_repair.record(name, "repaired")
+    return result
+
+
+def _parse_strict(
+    schema: type[SchemaType] | TypeAdapter[SchemaType], response: str
+) -> SchemaType:
+    data = response[response.index("{") : response.rindex("}") + 1]
+
+    # strip control characters from data
+    data = re.sub(r"[\x00-\x1f\x7f]", "", data)
+
+    if isinstance(schema, TypeAdapter):
+        return schema.validate_json(data)
+    else:
+        return schema.model_validate_json(data)
+
+
+# Expected protocol, which the gateway does not document: the client sends the
+# same body as a "call" request over the websocket, with "action": "streamCall".
+# The gateway answers with frames of the form
+#
+#     {"delta": "<next piece of text>"}
+#
+# and ends with one frame containing {"result": "<complete text>"} (which may
+# also carry a last "delta"). Frames with only a "message" are status updates
+# and skipped, as for embeddings, except "Internal server error". Anything else,
+# or no frame within _STREAM_FRAME_TIMEOUT, fails the stream.
+async def _generate_stream(
+    model: Model,
+    prompt: str,
+    system: str,
+    temperature: float | None = None,
+    limits: dict | None = None,
+) -> AsyncIterator[str]:
+    action = {
+        "action": "streamCall",
+        "model": model.value,
+        "system": system,
+        "query": prompt,
+        "lastk": 0,
+        "temperature": temperature,
+        "cache_match_thresh": 1.1,
+        **(limits or {}),
+    }
+    action = {k: v for k, v in action.items() if v is not None}
 
+    async with ws.connect(_LLM_URI) as conn:
+        await conn.send(json.dumps(action))
+
+        while True:
+            response_dict = json.loads(
+                await asyncio.wait_for(conn.recv(), _STREAM_FRAME_TIMEOUT)
+            )
+
+            if response_dict.get("message") == "Internal server error":
+                raise RuntimeError("Could not stream LLM call: ISE")
+            if "delta" in response_dict:
+                yield response_dict["delta"]
+            if "result" in response_dict:
+                return
+            if "delta" not in response_dict and "message" not in response_dict:
+                raise RuntimeError(f"Unexpected stream frame: {response_dict}")
+
+
+_stream_fallbacks = 0
+
+
+# Like generate, but calls on_partial with the string fields of the JSON object
+# parsed so far while it is streamed (at most every _STREAM_PARTIAL_INTERVAL),
+# along with the keys whose values are complete. Falls back to generate when
+# streaming is disabled or fails.
+async def generate_streamed(
+    schema: type[SchemaType],
+    model: Model,
+    prompt: str,
+    system: str,
+    on_partial: Callable[[dict[str, str], set[str]], None],
+    temperature: float | None = None,
+    call_site: str | None = None,
+    max_tokens: int | None = None,
+    stop: list[str] | None = None,
+) -> SchemaType:
+    limits = _limits(call_site, max_tokens, stop)
+    if not _STREAMING:
+        return await generate(schema, model, prompt, system, temperature, **limits)
+
+    response = ""
+    try:
+        last_partial = 0.0
+        async for delta in _generate_stream(model, prompt, system, temperature, limits):
+            response += delta
+
+            if time.monotonic() - last_partial >= _STREAM_PARTIAL_INTERVAL:
+                last_partial = time.monotonic()
+                on_partial(*parse_partial_object(response))
+
+        return _parse(schema, response)
     except Exception as e:
-        logging.warning(f"Generate Unexpected error: {e}. {response}")
+        global _stream_fallbacks
+        _stream_fallbacks += 1
+
+        # Logged loudly once, so that a gateway without streaming support does
+        # not silently turn LLM_STREAMING into regular calls.
+        log = logging.warning if _stream_fallbacks == 1 else logging.debug
+        log(
+            f"LLM_STREAMING is enabled but streaming failed ({e}), falling back to "
+            f"a regular call ({_stream_fallbacks} fallbacks so far). {response}"
+        )
 
-        raise RuntimeError("Could not generate valid response") from e
+    return await generate(schema, model, prompt, system, temperature, **limits)
 
 
 _EMBED_SEMAPHORE = asyncio.Semaphore(32)
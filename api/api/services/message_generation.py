@@ -207,6 +207,7 @@ async def generate_message(
     response = await llm.generate(
         schema=Message,
         model=llm.Model.GPT_4o,
+        call_site="generate_message",
         system=system_prompt,
         prompt=prompt_data,
     )
@@ -242,6 +243,7 @@ async def decide_whether_to_message(
     res = await llm.generate(
         schema=DecideToMessageOutput,
         model=llm.Model.GPT_4o,
+        call_site="decide_whether_to_message",
         system=system_prompt,
         prompt=prompt_data,
     )
@@ -0,0 +1,91 @@
+from contextlib import suppress
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+def _read_string(text: str, i: int) -> tuple[str, int, bool]:
+    chars = []
+    i += 1
+
+    while i < len(text):
+        char = text[i]
+
+        if char == '"':
+            return "".join(chars), i + 1, True
+
+        if char != "\\":
+            chars.append(char)
+            i += 1
+            continue
+
+        if i + 1 >= len(text):
+            break
+
+        escape = text[i + 1]
+        if escape == "u":
+            if i + 6 > len(text):
+                break
+            with suppress(ValueError):
+                chars.append(chr(int(text[i + 2 : i + 6], 16)))
+            i += 6
+        else:
+            chars.append(_ESCAPES.get(escape, escape))
+            i += 2
+
+    return "".join(chars), len(text), False
+
+
+# Parses the string fields of a JSON object that is still being generated.
+# Returns the values seen so far, including a partial last value, and the keys
+# whose values are complete.
+def parse_partial_object(text: str) -> tuple[dict[str, str], set[str]]:
+    values: dict[str, str] = {}
+    complete: set[str] = set()
+
+    i = text.find("{")
+    if i < 0:
+        return values, complete
+    i += 1
+
+    while True:
+        while i < len(text) and text[i] in " \t\r\n,":
+            i += 1
+
+        if i >= len(text) or text[i] != '"':
+            break
+
+        key, i, closed = _read_string(text, i)
+        if not closed:
+            break
+
+        while i < len(text) and text[i] in " \t\r\n:":
+            i += 1
+
+        if i >= len(text):
+            break
+
+        if text[i] != '"':
+            while i < len(text) and text[i] not in ",}":
+                i += 1
+            if i >= len(text) or text[i] == "}":
+                break
+            continue
+
+        value, i, closed = _read_string(text, i)
+        values[key] = value
+
+        if not closed:
+            break
+
+        complete.add(key)
+
+    return values, complete
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable
+from typing import Any, Callable, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class Node(NamedTuple):
+    run: Callable[..., Awaitable[Any]]
+    inputs: tuple[str, ...]
+    on_result: Callable[[Any], None] | None
+
+
+class NodeTiming(NamedTuple):
+    started: float
+    finished: float
+
+    @property
+    def duration(self) -> float:
+        return self.finished - self.started
+
+
+# Runs each step as soon as its inputs have finished. Steps receive the results
+# of their inputs as keyword arguments, and on_result is called before any
+# dependent step starts so it can publish to state that later steps read.
+class Pipeline:
+    def __init__(self, name: str):
+        self.name = name
+        self._nodes: dict[str, Node] = {}
+        self.timings: dict[str, NodeTiming] = {}
+
+    def add(
+        self,
+        name: str,
+        run: Callable[..., Awaitable[Any]],
+        inputs: tuple[str, ...] = (),
+        on_result: Callable[[Any], None] | None = None,
+    ):
+        for dependency in inputs:
+            if dependency not in self._nodes:
+                raise ValueError(f"Unknown input {dependency!r} for step {name!r}")
+
+        self._nodes[name] = Node(run, inputs, on_result)
+
+    async def run(self) -> dict[str, Any]:
+        start = time.monotonic()
+        tasks: dict[str, asyncio.Task] = {}
+
+        async def run_node(name: str, node: Node):
+            inputs = {dependency: await tasks[dependency] for dependency in node.inputs}
+
+            started = time.monotonic() - start
+            result = await node.run(**inputs)
+            self.timings[name] = NodeTiming(started, time.monotonic() - start)
+
+            if node.on_result is not None:
+                node.on_result(result)
+
+            return result
+
+        for name, node in self._nodes.items():
+            tasks[name] = asyncio.create_task(run_node(name, node))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        logger.info(
+            f"Pipeline {self.name} took {time.monotonic() - start:.2f}s, "
+            f"critical path: {self.format_critical_path()}"
+        )
+
+        return {name: task.result() for name, task in tasks.items()}
+
+    def critical_path(self) -> list[str]:
+        if not self.timings:
+            return []
+
+        path = [max(self.timings, key=lambda name: self.timings[name].finished)]
+
+        while inputs := self._nodes[path[-1]].inputs:
+            path.append(max(inputs, key=lambda name: self.timings[name].finished))
+
+        return path[::-1]
+
+    def format_critical_path(self) -> str:
+        return " -> ".join(
+            f"{name} ({self.timings[name].duration:.2f}s)"
+            for name in self.critical_path()
+        )
@@ -0,0 +1,190 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import NamedTuple
+
+
+class RateLimit(NamedTuple):
+    per_minute: float
+    burst: int
+
+
+class TokenBucket:
+    def __init__(self, limit: RateLimit):
+        self._rate = limit.per_minute / 60
+        self._capacity = limit.burst
+        self._tokens = float(limit.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self._rate
+        )
+        self._updated = now
+
+    def available(self, cost: float = 1) -> bool:
+        self._refill()
+        return self._tokens >= cost
+
+    def take(self, cost: float = 1) -> bool:
+        if not self.available(cost):
+            return False
+
+        self._tokens -= cost
+        return True
+
+    def retry_after(self, cost: float = 1) -> float:
+        self._refill()
+        return max(0, (cost - self._tokens) / self._rate)
+
+
+DEFAULT_RATE_LIMIT = "*"
+
+CONNECTION_RATE_LIMITS = {
+    "create-chat": RateLimit(per_minute=2, burst=3),
+    "suggest-messages": RateLimit(per_minute=10, burst=3),
+    "draft": RateLimit(per_minute=30, burst=5),
+    "send-message": RateLimit(per_minute=20, burst=5),
+    DEFAULT_RATE_LIMIT: RateLimit(per_minute=120, burst=30),
+}
+
+USER_RATE_LIMITS = {
+    "create-chat": RateLimit(per_minute=3, burst=5),
+    "suggest-messages": RateLimit(per_minute=15, burst=5),
+    "draft": RateLimit(per_minute=45, burst=8),
+    # Checked by the draft handler, as variations cost more than classifying.
+    "draft-variations": RateLimit(per_minute=6, burst=3),
+    "send-message": RateLimit(per_minute=30, burst=8),
+    DEFAULT_RATE_LIMIT: RateLimit(per_minute=240, burst=60),
+}
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, RateLimit]):
+        self._limits = limits
+        self._buckets: dict[str, TokenBucket] = {}
+
+    def _bucket(self, key: str) -> TokenBucket:
+        if key not in self._buckets:
+            limit = self._limits.get(key, self._limits[DEFAULT_RATE_LIMIT])
+            self._buckets[key] = TokenBucket(limit)
+
+        return self._buckets[key]
+
+    def check(self, key: str) -> bool:
+        return self._bucket(key).available()
+
+    def allow(self, key: str) -> bool:
+        return self._bucket(key).take()
+
+    def retry_after(self, key: str) -> float:
+        return self._bucket(key).retry_after()
+
+
+# Estimated number of LLM calls each expensive event triggers. Drafts are
+# admitted per call by drafts.start, as they may not make any.
+EVENT_COSTS = {
+    "create-chat": 2,
+    "suggest-messages": 5,
+    "send-message": 3,
+    "draft": 1,
+    "view-suggestion": 1,
+    "prefetch-feedback": 1,
+}
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class Admission:
+    def __init__(
+        self,
+        controller: "AdmissionController",
+        cost: int,
+        waiter: asyncio.Future[None] | None,
+    ):
+        self._controller = controller
+        self.cost = cost
+        self._waiter = waiter
+        self.released = False
+
+    @property
+    def position(self) -> int:
+        return self._controller.position(self)
+
+    async def __aenter__(self):
+        if self._waiter is not None:
+            try:
+                await self._waiter
+            except asyncio.CancelledError:
+                self._controller.cancel(self)
+                raise
+
+    async def __aexit__(self, *_):
+        self._controller.release(self)
+
+
+class AdmissionController:
+    def __init__(self, max_backlog: int, max_queue: int):
+        self._max_backlog = max_backlog
+        self._max_queue = max_queue
+        self._backlog = 0
+        self._queue: deque[tuple[Admission, asyncio.Future[None]]] = deque()
+
+    def backlog(self) -> int:
+        return self._backlog
+
+    def _fits(self, cost: int) -> bool:
+        return self._backlog == 0 or self._backlog + cost <= self._max_backlog
+
+    def request(self, cost: int) -> Admission:
+        if not self._queue and self._fits(cost):
+            self._backlog += cost
+            return Admission(self, cost, None)
+
+        if len(self._queue) >= self._max_queue:
+            raise AdmissionRejected()
+
+        waiter = asyncio.get_running_loop().create_future()
+        admission = Admission(self, cost, waiter)
+        self._queue.append((admission, waiter))
+        return admission
+
+    def position(self, admission: Admission) -> int:
+        for i, (queued, _) in enumerate(self._queue):
+            if queued is admission:
+                return i + 1
+        return 0
+
+    def _wake(self):
+        while self._queue and self._fits(self._queue[0][0].cost):
+            admission, waiter = self._queue.popleft()
+            self._backlog += admission.cost
+            waiter.set_result(None)
+
+    def release(self, admission: Admission):
+        if admission.released:
+            return
+
+        admission.released = True
+        self._backlog -= admission.cost
+        self._wake()
+
+    def cancel(self, admission: Admission):
+        for entry in self._queue:
+            if entry[0] is admission:
+                self._queue.remove(entry)
+                admission.released = True
+                self._wake()
+                return
+
+        self.release(admission)
+
+
+admission = AdmissionController(
+    max_backlog=int(os.getenv("LLM_MAX_BACKLOG", "64")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "256")),
+)
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from api.schemas.chat import ChatData, ChatMessage, Suggestion
+from api.schemas.user import UserData, UserPersonalizationOptions
+from api.services import chat_generation, message_generation, rate_limit
+
+logger = logging.getLogger(__name__)
+
+_COHORT_BUDGET = int(os.getenv("SPECULATION_COHORT_BUDGET", "2000"))
+_BUDGET_WINDOW = float(
+    os.getenv("SPECULATION_BUDGET_WINDOW_SECONDS", str(24 * 60 * 60))
+)
+_MAX_BACKLOG = int(os.getenv("SPECULATION_MAX_BACKLOG", "8"))
+
+
+class SpeculativeReply:
+    def __init__(
+        self,
+        messages: int,
+        state: str,
+        objective: str | None,
+        problem: str | None,
+        task: asyncio.Task[str],
+    ):
+        self.messages = messages
+        self.state = state
+        self.objective = objective
+        self.problem = problem
+        self.task = task
+
+
+class CohortBudget:
+    def __init__(self, limit: int, window: float):
+        self._limit = limit
+        self._window = window
+        self._window_start = time.monotonic()
+        self._spent: dict[ObjectId | None, int] = {}
+
+    def spend(self, cohort: ObjectId | None, cost: int) -> bool:
+        now = time.monotonic()
+        if now - self._window_start >= self._window:
+            self._spent.clear()
+            self._window_start = now
+
+        spent = self._spent.get(cohort, 0)
+        if spent + cost > self._limit:
+            return False
+
+        self._spent[cohort] = spent + cost
+        return True
+
+
+class SpeculationMetrics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def hit_rate(self) -> float:
+        taken = self.hits + self.misses
+        return self.hits / taken if taken else 0
+
+
+budget = CohortBudget(_COHORT_BUDGET, _BUDGET_WINDOW)
+metrics = SpeculationMetrics()
+
+_pending: dict[ObjectId, list[SpeculativeReply]] = {}
+
+
+def _consume_result(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Speculative reply failed: {task.exception()}")
+
+
+def _speculate(
+    chat: ChatData, pers: UserPersonalizationOptions, suggestion: Suggestion
+) -> SpeculativeReply:
+    hypothetical = chat.model_copy(deep=True)
+    hypothetical.messages.append(
+        ChatMessage(
+            sender=pers.name,
+            content=suggestion.message,
+            created_at=datetime.now(timezone.utc),
+        )
+    )
+    hypothetical.last_suggestions = hypothetical.suggestions
+    hypothetical.suggestions = None
+
+    state, objective = chat_generation.next_state(hypothetical, suggestion.objective)
+
+    async def generate():
+        async with rate_limit.admission.request(1):
+            return await chat_generation.generate_agent_message(
+                pers=pers,
+                chat=hypothetical,
+                state=state,
+                objective=objective,
+                problem=suggestion.problem,
+                bypass_objective_prompt_check=(objective == "blunt-initial"),
+            )
+
+    task = asyncio.create_task(generate())
+    task.add_done_callback(_consume_result)
+
+    return SpeculativeReply(
+        len(hypothetical.messages), state, objective, suggestion.problem, task
+    )
+
+
+def discard(chat_id: ObjectId):
+    for reply in _pending.pop(chat_id, []):
+        reply.task.cancel()
+        metrics.wasted += 1
+
+
+def start(chat: ChatData, user: UserData):
+    discard(chat.id)
+
+    if not chat.options.speculative_replies or not chat.suggestions:
+        return
+
+    # Speculation only uses spare LLM capacity.
+    if rate_limit.admission.backlog() > _MAX_BACKLOG:
+        return
+
+    if not budget.spend(user.cohort, len(chat.suggestions)):
+        logger.info(f"Speculation budget exhausted for cohort {user.cohort}")
+        return
+
+    assert user.personalization
+    pers = message_generation.get_personalization_options(
+        user.personalization,
+        chat.options.suggestion_generation == "content-inspired",
+    )
+
+    _pending[chat.id] = [
+        _speculate(chat, pers, suggestion) for suggestion in chat.suggestions
+    ]
+
+
+def take(chat_id: ObjectId, index: int) -> SpeculativeReply | None:
+    replies = _pending.pop(chat_id, None)
+
+    if replies is None:
+        return None
+
+    for i, reply in enumerate(replies):
+        if i != index:
+            reply.task.cancel()
+            metrics.wasted += 1
+
+    return replies[index] if 0 <= index < len(replies) else None
+
+
+async def claim(
+    reply: SpeculativeReply | None,
+    chat: ChatData,
+    state: str,
+    objective: str | None,
+    problem: str | None,
+) -> str | None:
+    if reply is None:
+        return None
+
+    content = None
+    if (reply.messages, reply.state, reply.objective, reply.problem) == (
+        len(chat.messages),
+        state,
+        objective,
+        problem,
+    ):
+        # A cancelled reply counts as a miss, which asyncio.CancelledError
+        # would otherwise escape as it is not an Exception.
+        if not reply.task.cancelled():
+            try:
+                content = await reply.task
+            except Exception:
+                content = None
+    else:
+        reply.task.cancel()
+
+    if content is None:
+        metrics.misses += 1
+    else:
+        metrics.hits += 1
+
+    logger.info(f"Speculative reply hit rate {metrics.hit_rate():.0%}")
+    return content
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from api.db import topic_cache as db_topic_cache
+from api.db.topic_cache import CachedTopic
+from api.services import llm
+
+logger = logging.getLogger(__name__)
+
+_CACHE_SIZE = int(os.getenv("TOPIC_CACHE_SIZE", "500"))
+_SIMILARITY_THRESHOLD = float(os.getenv("TOPIC_CACHE_SIMILARITY", "0.85"))
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not update topic cache: {task.exception()}")
+
+
+# Only used as the lookup key; symbols that change the meaning of a topic, as
+# in "C++" or "C#", are kept.
+def normalize_topic(topic: str) -> str:
+    return " ".join(re.sub(r"[.,!?;:'\"()\[\]]", " ", topic.lower()).split())
+
+
+class TopicCache:
+    def __init__(self, size: int, similarity_threshold: float):
+        self._size = size
+        self._similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[str, CachedTopic] = OrderedDict()
+        self._embeddings: dict[str, np.ndarray] = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+        self._touches: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self):
+        async with self._load_lock:
+            if self._loaded:
+                return
+
+            entries = sorted(await db_topic_cache.get_all(), key=lambda e: e.last_used)
+            for entry in entries[-self._size :]:
+                self._add(entry)
+
+            self._loaded = True
+
+    def _add(self, entry: CachedTopic):
+        self._entries[entry.topic] = entry
+        self._entries.move_to_end(entry.topic)
+
+        if entry.embedding is not None:
+            embedding = np.array(entry.embedding)
+            self._embeddings[entry.topic] = embedding / np.linalg.norm(embedding)
+
+    def _evict(self) -> list[str]:
+        evicted = []
+
+        while len(self._entries) > self._size:
+            topic, _ = self._entries.popitem(last=False)
+            self._embeddings.pop(topic, None)
+            evicted.append(topic)
+
+        return evicted
+
+    async def _embed(self, topic: str) -> np.ndarray | None:
+        try:
+            embedding = await llm.embed(topic)
+        except Exception:
+            logger.warning(f"Could not embed topic {topic!r}", exc_info=True)
+            return None
+
+        return embedding / np.linalg.norm(embedding)
+
+    def _most_similar(self, embedding: np.ndarray) -> str | None:
+        best_topic, best_similarity = None, self._similarity_threshold
+
+        for topic, cached in self._embeddings.items():
+            similarity = float(np.dot(embedding, cached))
+            if similarity >= best_similarity:
+                best_topic, best_similarity = topic, similarity
+
+        return best_topic
+
+    # Also returns the embedding computed for a miss, so that put does not have
+    # to embed the topic again.
+    async def get(self, topic: str) -> tuple[CachedTopic | None, np.ndarray | None]:
+        await self._load()
+
+        topic = normalize_topic(topic)
+        match = topic if topic in self._entries else None
+        embedding = None
+
+        if match is None and self._embeddings:
+            embedding = await self._embed(topic)
+            if embedding is not None:
+                match = self._most_similar(embedding)
+
+        if match is None:
+            self.misses += 1
+            return None, embedding
+
+        self.hits += 1
+        entry = self._entries[match]
+        entry.last_used = datetime.now(timezone.utc)
+        self._entries.move_to_end(match)
+        touch = asyncio.create_task(db_topic_cache.touch(match, entry.last_used))
+        self._touches.add(touch)
+        touch.add_done_callback(self._touches.discard)
+        touch.add_done_callback(_log_failure)
+        return entry, None
+
+    async def put(
+        self,
+        topic: str,
+        introduction: str,
+        scenario: str,
+        embedding: np.ndarray | None = None,
+    ):
+        await self._load()
+
+        topic = normalize_topic(topic)
+        if topic in self._entries:
+            return
+
+        if embedding is None:
+            embedding = await self._embed(topic)
+        entry = CachedTopic(
+            topic=topic,
+            embedding=embedding.tolist() if embedding is not None else None,
+            introduction=introduction,
+            scenario=scenario,
+            last_used=datetime.now(timezone.utc),
+        )
+
+        self._add(entry)
+        await db_topic_cache.upsert(entry)
+
+        for evicted in self._evict():
+            await db_topic_cache.delete(evicted)
+
+
+topic_cache = TopicCache(_CACHE_SIZE, _SIMILARITY_THRESHOLD)
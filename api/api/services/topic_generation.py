@@ -11,9 +11,11 @@ async def generate_topic_message(agent: str, topic: str):
     result = await llm.generate(
         schema=GeneratedTopic,
         model=llm.Model.GPT_4o,
+        call_site="generate_topic_message",
         system="You are facilitating a casual, engaging conversation between a user and a friend on a specific topic. "
         "The setting is relaxed and informal, allowing for open dialogue and natural curiosity. "
         "Create a welcoming introduction that sets the tone for this conversation. "
+        "Refer to people by name or as they/them, never with gendered pronouns. "
         "Respond with a JSON object containing an 'introduction' key and the introduction text as its value.",
         prompt=f"The user will engage in an informal discussion with {agent}, a friend "
         f"who is an enthusiast/has great knowledge of/expert in the following topic: {topic}. The reading/flow if the intro should be good."
@@ -51,10 +53,12 @@ async def generate_scenario_message(user: str, agent: str, topic: str):
     result = await llm.generate(
         schema=GeneratedScenario,
         model=llm.Model.GPT_4o,
+        call_site="generate_scenario_message",
         system="You are given an input JSON object. Ensure that the language flows "
         "properly. If so, you can return an object with the same 'scenario' key and "
         "the same text as its value. If not, rephrase it to make it more natural and "
-        "return the new object. Respond with a JSON  containing a 'scenario' key.",
+        "return the new object. Refer to people by name or as they/them, never with "
+        "gendered pronouns. Respond with a JSON  containing a 'scenario' key.",
         prompt=GeneratedScenario(scenario=scenario).model_dump_json(),
     )
 
@@ -1,111 +1,325 @@
 import asyncio
-import json
+import logging
+from collections.abc import Coroutine
+from typing import Any, Callable
 
 from bson import ObjectId
-from fastapi import WebSocket
+from fastapi import WebSocketDisconnect
+from pydantic import ValidationError
 
-from api.schemas.chat import ChatApi, chat_info_list_adapter
+from api.schemas.chat import ChatApi, ChatVersion, chat_info_list_adapter
+from api.schemas.client_event import (
+    CheckpointRatingEvent,
+    ClientEvent,
+    CreateChatEvent,
+    DraftEvent,
+    IntroductionSeenEvent,
+    LoadChatEvent,
+    LoadChatsEvent,
+    MarkReadEvent,
+    PrefetchFeedbackEvent,
+    RateFeedbackEvent,
+    SendMessageEvent,
+    SuggestMessagesEvent,
+    ViewSuggestionEvent,
+    client_event_adapter,
+)
 from api.schemas.user import UserData
-from api.services import chat_service
+from api.services import chat_service, drafts, rate_limit
+from api.services.chat_socket import ChatSocket
 from api.services.connection_manager import ConnectionManager
+from api.services.rate_limit import (
+    CONNECTION_RATE_LIMITS,
+    EVENT_COSTS,
+    Admission,
+    AdmissionRejected,
+    RateLimiter,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _sync_chat(chat_state: chat_service.ChatState) -> dict:
+    return {
+        "type": "sync-chat",
+        "chat": ChatApi.from_data(chat_state.read()).model_dump(mode="json"),
+        "epoch": chat_state.epoch,
+        "version": chat_state.version,
+    }
 
 
 async def handle_connection(
-    ws: WebSocket, connection: ConnectionManager, connection_id: str, user: UserData
+    socket: ChatSocket,
+    connection: ConnectionManager,
+    connection_id: str,
+    user: UserData,
+    versions: dict[ObjectId, ChatVersion] | None = None,
 ):
-    all_chats = await chat_service.get_chats(user.id)
+    # Listen before loading the chat list so that chats published meanwhile
+    # (e.g. while provisioning) are not missed, but send them after it.
+    buffered: list[dict] | None = []
+
+    def send_later(message: dict):
+        if buffered is not None:
+            buffered.append(message)
+        else:
+            socket.send_soon(message)
+
+    def on_change(chat_state: chat_service.ChatState):
+        send_later(_sync_chat(chat_state))
+
+    connection.add_listener(connection_id, on_change, send_later)
+
+    chat_infos, next_cursor = await chat_service.get_chats(user.id)
 
-    await ws.send_json(
+    await socket.send(
         {
             "type": "sync-chats",
-            "chats": json.loads(chat_info_list_adapter.dump_json(all_chats)),
+            "chats": chat_info_list_adapter.dump_python(chat_infos, mode="json"),
+            "next_cursor": next_cursor,
         }
     )
 
-    async def get_chat_state(id: ObjectId) -> chat_service.ChatState:
+    for message in buffered:
+        await socket.send(message)
+    buffered = None
+
+    async def find_chat_state(id: ObjectId) -> chat_service.ChatState | None:
         if chat_state := connection.get_state(id):
             return chat_state
 
         chat = await chat_service.get_chat(id, user.id)
-        assert chat
+        if not chat:
+            return None
+
         chat_state = chat_service.ChatState(chat)
         connection.add_state(chat_state)
         return chat_state
 
-    def on_change(chat_state: chat_service.ChatState):
-        def on_change_inner():
-            return ws.send_json(
-                {
-                    "type": "sync-chat",
-                    "chat": json.loads(
-                        ChatApi.from_data(chat_state.read()).model_dump_json()
-                    ),
-                }
-            )
+    async def get_chat_state(id: ObjectId) -> chat_service.ChatState:
+        chat_state = await find_chat_state(id)
+        assert chat_state
+        return chat_state
 
-        asyncio.create_task(on_change_inner())
+    if connection.provisioning:
+        await socket.send(
+            {"type": "provisioning-chats", "pending": connection.provisioning}
+        )
 
-    connection.add_listener(connection_id, on_change)
+    for id, version in (versions or {}).items():
+        # Chats that were deleted or belong to someone else are not resumed.
+        chat_state = await find_chat_state(id)
+        if not chat_state:
+            continue
 
-    while event := await ws.receive_json():
-        if event["type"] == "create-chat":
-            chat = await chat_service.create_chat(user)
-            await ws.send_json(
-                {
-                    "type": "sync-chat",
-                    "chat": json.loads(ChatApi.from_data(chat).model_dump_json()),
-                }
-            )
-        elif event["type"] == "load-chat":
-            chat = await get_chat_state(ObjectId(event["id"]))
+        changes = chat_state.changes_since(version.epoch, version.version)
 
-            await ws.send_json(
+        if changes is None:
+            await socket.send(_sync_chat(chat_state))
+        elif changes:
+            await socket.send(
                 {
-                    "type": "sync-chat",
-                    "chat": json.loads(
-                        ChatApi.from_data(chat.read()).model_dump_json()
-                    ),
+                    "type": "patch-chat",
+                    "id": str(id),
+                    "changes": changes,
+                    "epoch": chat_state.epoch,
+                    "version": chat_state.version,
                 }
             )
-        elif event["type"] == "suggest-messages":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
-            connection.add_action(
-                chat_state,
-                chat_service.suggest_messages(chat_state, user, event["message"]),
-            )
 
-        elif event["type"] == "send-message":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
+    def _ack(request_id: str, status: str) -> dict:
+        return {"type": "ack", "request_id": request_id, "status": status}
 
-            connection.add_action(
-                chat_state, chat_service.send_message(chat_state, user, event["index"])
-            )
+    def _error(request_id: str | None, error: Exception) -> dict:
+        return {
+            "type": "error",
+            "request_id": request_id,
+            "error": str(error) or type(error).__name__,
+        }
 
-        elif event["type"] == "mark-read":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
+    async def send_ack(request_id: str | None, status: str):
+        if request_id is not None:
+            await socket.send(_ack(request_id, status))
 
-            connection.add_action(chat_state, chat_service.mark_read(chat_state))
-        elif event["type"] == "rate-feedback":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
-            connection.add_action(
-                chat_state,
-                chat_service.rate_feedback(chat_state, event["index"], event["rating"]),
-            )
-        elif event["type"] == "view-suggestion":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
-            connection.add_action(
-                chat_state,
-                chat_service.mark_view_suggestion(chat_state, event["index"]),
-            )
-        elif event["type"] == "checkpoint-rating":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
-            connection.add_action(
-                chat_state, chat_service.checkpoint_rating(chat_state, event["ratings"])
+    async def send_error(request_id: str | None, error: Exception):
+        await socket.send(_error(request_id, error))
+
+    # Actions finish after their event was handled, possibly after the socket
+    # was closed, so their result is sent without awaiting it.
+    def on_done(request_id: str | None):
+        def on_done_inner(error: Exception | None):
+            if error is not None:
+                socket.send_soon(_error(request_id, error))
+            elif request_id is not None:
+                socket.send_soon(_ack(request_id, "completed"))
+
+        return on_done_inner
+
+    async def dispatch(
+        event: ClientEvent,
+    ) -> tuple[chat_service.ChatState, Coroutine[Any, Any, Any]] | None:
+        match event:
+            case LoadChatsEvent(before=before):
+                chat_infos, next_cursor = await chat_service.get_chats(user.id, before)
+                await socket.send(
+                    {
+                        "type": "more-chats",
+                        "chats": chat_info_list_adapter.dump_python(
+                            chat_infos, mode="json"
+                        ),
+                        "next_cursor": next_cursor,
+                    }
+                )
+                return None
+            case LoadChatEvent(id=id):
+                chat_state = await get_chat_state(id)
+                await socket.send(_sync_chat(chat_state))
+                return None
+            case SuggestMessagesEvent(id=id, message=message):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.suggest_messages(
+                    chat_state, user, message
+                )
+            case DraftEvent(id=id, message=message, variations=variations):
+                chat_state = await get_chat_state(id)
+                variations = variations and connection.rate_limiter.allow(
+                    "draft-variations"
+                )
+                drafts.start(chat_state.read(), user, message, variations)
+                return None
+            case SendMessageEvent(id=id, index=index):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.send_message(chat_state, user, index)
+            case MarkReadEvent(id=id):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.mark_read(chat_state)
+            case RateFeedbackEvent(id=id, index=index, rating=rating):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.rate_feedback(chat_state, index, rating)
+            case ViewSuggestionEvent(id=id, index=index):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.mark_view_suggestion(
+                    chat_state, user, index
+                )
+            case PrefetchFeedbackEvent(id=id, index=index):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.suggestion_feedback(
+                    chat_state, user, index
+                )
+            case CheckpointRatingEvent(id=id, ratings=ratings):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.checkpoint_rating(chat_state, ratings)
+            case IntroductionSeenEvent(id=id):
+                chat_state = await get_chat_state(id)
+                return chat_state, chat_service.introduction_seen(chat_state)
+
+    async def send_busy(event: ClientEvent, status: str, **data):
+        await socket.send(
+            {
+                "type": "busy",
+                "request_id": event.request_id,
+                "event": event.type,
+                "status": status,
+                **data,
+            }
+        )
+
+    async def admitted(admission: Admission, action: Coroutine[Any, Any, Any]):
+        async with admission:
+            return await action
+
+    async def create_chat():
+        chat = await chat_service.create_chat(user)
+        chat_state = chat_service.ChatState(chat)
+        connection.add_state(chat_state)
+        await socket.send(_sync_chat(chat_state))
+
+    # Chat creation does not belong to a chat's actions but must not block the
+    # receive loop while it waits for admission.
+    background_tasks: set[asyncio.Task] = set()
+
+    def run_in_background(
+        coroutine: Coroutine[Any, Any, Any], on_done: Callable[[Exception | None], None]
+    ):
+        async def run():
+            try:
+                await coroutine
+            except Exception as e:
+                logger.exception("Background action failed")
+                on_done(e)
+            else:
+                on_done(None)
+
+        task = asyncio.create_task(run())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    connection_rate_limiter = RateLimiter(CONNECTION_RATE_LIMITS)
+
+    while raw_event := await socket.receive():
+        try:
+            event = client_event_adapter.validate_python(raw_event)
+        except ValidationError as e:
+            request_id = (
+                raw_event.get("request_id") if isinstance(raw_event, dict) else None
             )
-        elif event["type"] == "introduction-seen":
-            chat_state = await get_chat_state(ObjectId(event["id"]))
-            connection.add_action(
-                chat_state, chat_service.introduction_seen(chat_state)
+            await send_error(request_id, e)
+            continue
+
+        rate_limiters = (connection_rate_limiter, connection.rate_limiter)
+        limited_by = next(
+            (
+                rate_limiter
+                for rate_limiter in rate_limiters
+                if not rate_limiter.check(event.type)
+            ),
+            None,
+        )
+
+        if limited_by is not None:
+            await send_busy(
+                event, "rate-limited", retry_after=limited_by.retry_after(event.type)
             )
+            continue
+
+        for rate_limiter in rate_limiters:
+            rate_limiter.allow(event.type)
+
+        admission = None
+        if event.type in EVENT_COSTS and not isinstance(event, DraftEvent):
+            try:
+                admission = rate_limit.admission.request(EVENT_COSTS[event.type])
+            except AdmissionRejected:
+                await send_busy(event, "rejected")
+                continue
+
+            if admission.position:
+                await send_busy(event, "queued", position=admission.position)
+
+        if isinstance(event, CreateChatEvent):
+            action = create_chat()
+            if admission is not None:
+                action = admitted(admission, action)
+            await send_ack(event.request_id, "queued")
+            run_in_background(action, on_done(event.request_id))
+            continue
+
+        try:
+            action = await dispatch(event)
+        except Exception as e:
+            if admission is not None:
+                rate_limit.admission.cancel(admission)
+            if isinstance(e, WebSocketDisconnect):
+                raise
+            logger.exception(f"Failed to handle {event.type} event")
+            await send_error(event.request_id, e)
+            continue
+
+        if action is None:
+            await send_ack(event.request_id, "completed")
         else:
-            raise ValueError(f"Unknown event type: {event['type']}")
+            chat_state, coroutine = action
+            if admission is not None:
+                coroutine = admitted(admission, coroutine)
+            await send_ack(event.request_id, "queued")
+            connection.add_action(chat_state, coroutine, on_done(event.request_id))
@@ -124,6 +124,9 @@ function ChatFeedbackDialog({
   );
 }
 
+const DRAFT_DEBOUNCE_MS = 600;
+const DRAFT_VARIATIONS_DEBOUNCE_MS = 2000;
+
 function Chat() {
   const { token } = useAuth();
   const {
@@ -134,7 +137,9 @@ function Chat() {
     sendChatMessage,
     createChat,
     suggestMessages,
+    sendDraft,
     sendViewSuggestion,
+    prefetchFeedback,
     setCurrentChatId,
     handleRate,
     handleCheckpointRate,
@@ -203,6 +208,29 @@ function Chat() {
     currentChat?.suggestions,
   ]);
 
+  const draftsEnabled =
+    !!currentChat &&
+    chatIsLoaded(currentChat) &&
+    currentChat.options.suggestion_generation === "content-inspired";
+
+  useEffect(() => {
+    if (!draftsEnabled || !input.trim()) {
+      return;
+    }
+
+    // Variations are only shown once the message is sent, so they are only
+    // requested when the user has stopped typing for a while.
+    const classify = setTimeout(() => sendDraft(input), DRAFT_DEBOUNCE_MS);
+    const vary = setTimeout(
+      () => sendDraft(input, true),
+      DRAFT_VARIATIONS_DEBOUNCE_MS,
+    );
+    return () => {
+      clearTimeout(classify);
+      clearTimeout(vary);
+    };
+  }, [input, draftsEnabled, sendDraft]);
+
   const handleSend = useCallback(() => {
     suggestMessages(input);
     setInput("");
@@ -438,6 +466,10 @@ function Chat() {
                                 conversation.
                               </p>
                             )}
+                            {currentChat.options.feedback_mode ===
+                              "on-suggestion" &&
+                              !currentChat.suggestions[selectedSuggestion]
+                                .feedback && <Loading />}
                             {currentChat.suggestions[selectedSuggestion]
                               .feedback && (
                               <div className="flex flex-col gap-2 w-full bg-secondary p-4 rounded-md">
@@ -496,6 +528,7 @@ function Chat() {
                                   sendViewSuggestion(i);
                                   setSelectedSuggestion(i);
                                 }}
+                                onMouseEnter={() => prefetchFeedback(i)}
                                 className="border rounded-md px-4 py-2 w-full text-left min-h-10"
                                 initial={{ opacity: 0 }}
                                 animate={{ opacity: 1 }}
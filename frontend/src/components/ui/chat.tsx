@@ -4,6 +4,7 @@ import { motion } from "framer-motion";
 import { ArrowDownIcon } from "lucide-react";
 import { Fragment, useCallback, useEffect, useMemo, useState } from "react";
 import { Button } from "./button";
+import { Loading } from "./loading";
 
 export interface Message {
   index?: number;
@@ -22,7 +23,7 @@ export interface InChatFeedback {
     body: string;
   };
   alternative: string | null;
-  alternative_feedback: string;
+  alternative_feedback: string | null;
   rating: number | null;
   created_at: string;
 }
@@ -362,7 +363,11 @@ function FeedbackBubble({
                   </p>
                 </>
               )}
-              <p className="text-sm">{feedback.alternative_feedback}</p>
+              {feedback.alternative_feedback ? (
+                <p className="text-sm">{feedback.alternative_feedback}</p>
+              ) : (
+                feedback.alternative && <Loading />
+              )}
             </div>
           </div>
         </div>
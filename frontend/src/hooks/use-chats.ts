@@ -13,7 +13,7 @@ type Feedback = {
   title: string;
   body: string;
   alternative: string;
-  alternative_feedback: string;
+  alternative_feedback: string | null;
 };
 
 export type InChatFeedback = {
@@ -71,28 +71,34 @@ export function isContentInChatFeedback(
 
 function useChatSocket<S, R>({
   onMessage,
+  resume,
 }: {
   onMessage: (message: R) => void;
+  resume: () => object;
 }) {
   const didUnmount = useRef(false);
   const { token } = useAuth();
 
-  const {
-    sendJsonMessage: sendSocketMessage,
-    lastMessage: lastSocketMessage,
-    readyState,
-  } = useWebsocket(`${import.meta.env.VITE_API_URL}/conversations/ws`, {
-    onOpen: () => {
-      sendSocketMessage({ token });
+  const { sendJsonMessage: sendSocketMessage, readyState } = useWebsocket(
+    `${import.meta.env.VITE_API_URL}/conversations/ws`,
+    {
+      onOpen: () => {
+        sendSocketMessage({ token, ...resume() });
+      },
+      // Handled per frame rather than through lastMessage, as a resume sends
+      // several frames at once and none of them may be skipped.
+      onMessage: (event) => {
+        onMessage(JSON.parse(event.data) as R);
+      },
+      retryOnError: true,
+      reconnectInterval: (lastAttemptNumber) =>
+        Math.min(16000, 2 ** lastAttemptNumber * 1000),
+      reconnectAttempts: 10,
+      shouldReconnect: () => {
+        return !didUnmount.current;
+      },
     },
-    retryOnError: true,
-    reconnectInterval: (lastAttemptNumber) =>
-      Math.min(16000, 2 ** lastAttemptNumber * 1000),
-    reconnectAttempts: 10,
-    shouldReconnect: () => {
-      return !didUnmount.current;
-    },
-  });
+  );
 
   useEffect(() => {
     didUnmount.current = false;
@@ -101,13 +107,6 @@ function useChatSocket<S, R>({
     };
   }, []);
 
-  useEffect(() => {
-    if (lastSocketMessage) {
-      const message = JSON.parse(lastSocketMessage.data) as R;
-      onMessage(message);
-    }
-  }, [lastSocketMessage, onMessage]);
-
   const sendMessage = (message: S) => {
     sendSocketMessage(message);
   };
@@ -119,14 +118,37 @@ function useChatSocket<S, R>({
   };
 }
 
+type RecvConnected = {
+  type: "connected";
+  connection_id: string;
+  resumed: boolean;
+};
+
 type RecvSyncChats = {
   type: "sync-chats";
   chats: Chat[];
+  next_cursor: string | null;
+};
+
+type RecvMoreChats = {
+  type: "more-chats";
+  chats: Chat[];
+  next_cursor: string | null;
 };
 
 type RecvSynChat = {
   type: "sync-chat";
   chat: Chat;
+  epoch: string;
+  version: number;
+};
+
+type RecvPatchChat = {
+  type: "patch-chat";
+  id: string;
+  changes: Partial<ChatLoaded>;
+  epoch: string;
+  version: number;
 };
 
 type RecvSuggestedMessages = {
@@ -135,7 +157,13 @@ type RecvSuggestedMessages = {
   messages: string[];
 };
 
-type Recv = RecvSyncChats | RecvSynChat | RecvSuggestedMessages;
+type Recv =
+  | RecvConnected
+  | RecvSyncChats
+  | RecvMoreChats
+  | RecvSynChat
+  | RecvPatchChat
+  | RecvSuggestedMessages;
 
 type SendChatMessage = {
   type: "send-message";
@@ -152,12 +180,24 @@ type SendLoadChat = {
   id: string;
 };
 
+type SendLoadChats = {
+  type: "load-chats";
+  before: string;
+};
+
 type SendSuggestMessages = {
   type: "suggest-messages";
   id: string;
   message: string;
 };
 
+type SendDraft = {
+  type: "draft";
+  id: string;
+  message: string;
+  variations?: boolean;
+};
+
 type SendMarkRead = {
   type: "mark-read";
   id: string;
@@ -169,6 +209,12 @@ type SendViewSuggestion = {
   index: number;
 };
 
+type SendPrefetchFeedback = {
+  type: "prefetch-feedback";
+  id: string;
+  index: number;
+};
+
 type SendRateFeedback = {
   type: "rate-feedback";
   id: string;
@@ -191,36 +237,88 @@ type Send =
   | SendChatMessage
   | SendCreateChat
   | SendLoadChat
+  | SendLoadChats
   | SendSuggestMessages
+  | SendDraft
   | SendMarkRead
   | SendViewSuggestion
+  | SendPrefetchFeedback
   | SendRateFeedback
   | SendCheckpointRate
   | SendIntroductionSeen;
 
+function chatsById(chats: Chat[]): { [key: string]: Chat } {
+  return chats.reduce((acc: { [key: string]: Chat }, chat: Chat) => {
+    acc[chat.id] = chat;
+    return acc;
+  }, {});
+}
+
 export function useChats({
   onChatCreated,
 }: {
   onChatCreated: (id: string) => void;
 }) {
   const [chats, setChats] = useState<{ [key: string]: Chat }>({});
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const { user } = useAuth();
 
+  // The session to resume when the socket reconnects: the connection id and
+  // the version of every chat that was loaded.
+  const session = useRef<{
+    connectionId: string | null;
+    versions: { [key: string]: { epoch: string; version: number } };
+  }>({ connectionId: null, versions: {} });
+
+  const resume = useCallback(() => {
+    const { connectionId, versions } = session.current;
+    return connectionId ? { connection_id: connectionId, versions } : {};
+  }, []);
+
   const onMessage = useCallback((message: Recv) => {
-    if (message.type === "sync-chats") {
-      setChats(
-        message.chats.reduce((acc: { [key: string]: Chat }, chat: Chat) => {
-          acc[chat.id] = chat;
-          return acc;
-        }, {}),
-      );
+    if (message.type === "connected") {
+      session.current.connectionId = message.connection_id;
+      if (!message.resumed) {
+        session.current.versions = {};
+      }
+    } else if (message.type === "sync-chats") {
+      // Resumed chats are kept, the server only sends what they missed.
+      setChats((chats) => {
+        const synced = chatsById(message.chats);
+        for (const id in session.current.versions) {
+          if (id in chats && chatIsLoaded(chats[id])) {
+            synced[id] = chats[id];
+          }
+        }
+        return synced;
+      });
+      setNextCursor(message.next_cursor);
+    } else if (message.type === "more-chats") {
+      // Chats synced in the meantime are newer than the page.
+      setChats((chats) => ({ ...chatsById(message.chats), ...chats }));
+      setNextCursor(message.next_cursor);
     } else if (message.type === "sync-chat") {
       if (!(message.chat.id in chats)) {
         onChatCreated(message.chat.id);
       }
+      session.current.versions[message.chat.id] = {
+        epoch: message.epoch,
+        version: message.version,
+      };
       setChats((chats) => {
         return { ...chats, [message.chat.id]: message.chat };
       });
+    } else if (message.type === "patch-chat") {
+      session.current.versions[message.id] = {
+        epoch: message.epoch,
+        version: message.version,
+      };
+      setChats((chats) => {
+        return {
+          ...chats,
+          [message.id]: { ...chats[message.id], ...message.changes } as Chat,
+        };
+      });
     } else if (message.type === "suggested-messages") {
       setChats((chats) => {
         return {
@@ -233,8 +331,16 @@ export function useChats({
 
   const { isConnected, isError, sendMessage } = useChatSocket<Send, Recv>({
     onMessage,
+    resume,
   });
 
+  // The chat list is sent in pages, load the rest as soon as each arrives.
+  useEffect(() => {
+    if (nextCursor) {
+      sendMessage({ type: "load-chats", before: nextCursor });
+    }
+  }, [nextCursor]);
+
   const sendChatMessage = useCallback(
     (id: string, index: number) => {
       setChats((chats) => {
@@ -288,6 +394,13 @@ export function useChats({
     [sendMessage],
   );
 
+  const sendDraft = useCallback(
+    (id: string, message: string, variations: boolean) => {
+      sendMessage({ type: "draft", id, message, variations });
+    },
+    [sendMessage],
+  );
+
   const markRead = useCallback(
     (id: string) => {
       setChats((chats) => {
@@ -305,6 +418,13 @@ export function useChats({
     [sendMessage],
   );
 
+  const prefetchFeedback = useCallback(
+    (id: string, index: number) => {
+      sendMessage({ type: "prefetch-feedback", id, index });
+    },
+    [sendMessage],
+  );
+
   const handleRate = useCallback(
     (id: string, index: number, rating: number) => {
       setChats((chats) => {
@@ -353,8 +473,10 @@ export function useChats({
     createChat,
     loadChat,
     suggestMessages,
+    sendDraft,
     markRead,
     sendViewSuggestion,
+    prefetchFeedback,
     handleRate,
     handleCheckpointRate,
     handleIntroductionSeen,
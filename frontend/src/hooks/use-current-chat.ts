@@ -20,7 +20,9 @@ export function useCurrentChat() {
         createChat: createChatRaw,
         loadChat,
         suggestMessages: suggestMessagesRaw,
+        sendDraft: sendDraftRaw,
         sendViewSuggestion: sendViewSuggestionRaw,
+        prefetchFeedback: prefetchFeedbackRaw,
         markRead,
         handleRate: handleRateRaw,
         handleCheckpointRate: handleCheckpointRateRaw,
@@ -73,6 +75,12 @@ export function useCurrentChat() {
         }
     }, [currentChat, suggestMessagesRaw]);
 
+    const sendDraft = useCallback((message: string, variations = false) => {
+        if (currentChat) {
+            sendDraftRaw(currentChat.id, message, variations);
+        }
+    }, [currentChat, sendDraftRaw]);
+
     const createChat = useCallback(() => {
         createChatRaw();
         setCurrentChatId(ZERO_OID);
@@ -84,6 +92,12 @@ export function useCurrentChat() {
         }
     }, [currentChat, sendViewSuggestionRaw]);
 
+    const prefetchFeedback = useCallback((index: number) => {
+        if (currentChat) {
+            prefetchFeedbackRaw(currentChat.id, index);
+        }
+    }, [currentChat, prefetchFeedbackRaw]);
+
     const handleRate = useCallback((index: number, rating: number) => {
         if (currentChat) {
             handleRateRaw(currentChat.id, index, rating);
@@ -108,9 +122,11 @@ export function useCurrentChat() {
         contacts,
         currentChat,
         suggestMessages,
+        sendDraft,
         sendChatMessage,
         createChat,
         sendViewSuggestion,
+        prefetchFeedback,
         setCurrentChatId,
         handleRate,
         handleCheckpointRate,
@@ -1,29 +1,37 @@
 import os
+import string
 import sys
 
 import requests
 
+API_URL = "https://production-427596434062.us-central1.run.app"
+LINK_URL = "https://autsim.pages.dev/auth"
+
+INIT_CHATS = [
+    {
+        "feedback_mode": "on-submit",
+        "suggestion_generation": "content-inspired",
+        "enabled_objectives": [
+            "non-literal-emoji",
+            "non-literal-figurative",
+            "yes-no-question",
+            "blunt",
+        ],
+        "gap": False,
+    }
+]
+
+
+def _headers():
+    return {"Authorization": f"Bearer {os.environ['API_KEY']}"}
+
 
 def generate_one():
     try:
-        body = [
-            {
-                "feedback_mode": "on-submit",
-                "suggestion_generation": "content-inspired",
-                "enabled_objectives": [
-                    "non-literal-emoji",
-                    "non-literal-figurative",
-                    "yes-no-question",
-                    "blunt",
-                ],
-                "gap": False,
-            }
-        ]
-
         response = requests.post(
-            "https://production-427596434062.us-central1.run.app/auth/internal-create-magic-link",
-            json=body,
-            headers={"Authorization": f"Bearer {os.environ['API_KEY']}"},
+            f"{API_URL}/auth/internal-create-magic-link",
+            json=INIT_CHATS,
+            headers=_headers(),
         )
 
         return response.json()
@@ -32,7 +40,49 @@ def generate_one():
         raise e
 
 
+def generate_bulk(count: int):
+    with requests.post(
+        f"{API_URL}/auth/internal-create-magic-links",
+        json={"count": count, "init_chats": INIT_CHATS},
+        headers=_headers(),
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                yield line
+
+
+def reissue(user: str):
+    # Accepts a user id or a previous link (or its secret).
+    secret = user.rstrip("/").rsplit("/", 1)[-1]
+    is_user_id = len(secret) == 24 and all(c in string.hexdigits for c in secret)
+    options = {"user_id": secret} if is_user_id else {"magic_link": secret}
+
+    response = requests.post(
+        f"{API_URL}/auth/internal-reissue-magic-link",
+        json=options,
+        headers=_headers(),
+    )
+    response.raise_for_status()
+
+    return response.json()
+
+
 if __name__ == "__main__":
-    assert len(sys.argv) >= 2
-    for n in range(int(sys.argv[1])):
-        print(f"https://autsim.pages.dev/auth/{generate_one()}")
+    if sys.argv[1:2] == ["--reissue"]:
+        assert len(sys.argv) == 3
+        print(f"{LINK_URL}/{reissue(sys.argv[2])}")
+        sys.exit()
+
+    args = [arg for arg in sys.argv[1:] if arg != "--bulk"]
+    assert len(args) >= 1
+    count = int(args[0])
+
+    if "--bulk" in sys.argv:
+        for secret in generate_bulk(count):
+            print(f"{LINK_URL}/{secret}")
+    else:
+        for _ in range(count):
+            print(f"{LINK_URL}/{generate_one()}")